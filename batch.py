@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import argparse
+import copy
+import json
+import time
+from contextlib import nullcontext
+from pathlib import Path
+from typing import TYPE_CHECKING, List, Tuple, Union
+
+from options import option_argv, option_error
+from profiling import Profile
+from summarizer import summarize_files
+from token_cache import TokenCache
+
+if TYPE_CHECKING:
+    from tiktoken import Encoding
+
+
+# options whose values are paths, which are relative to the batch manifest
+PATH_OPTIONS = ("folder", "output", "exclude_files")
+
+
+def load_roots(
+    manifest: Path, parser: argparse.ArgumentParser, args: argparse.Namespace,
+) -> List[Tuple[str, Union[argparse.Namespace, str]]]:
+    """
+    Returns the folder and the options of every root in a batch manifest, or what is wrong with the root's options.
+
+    The manifest is a JSON list of roots, or an object {"defaults": {...}, "roots": [...]}. A root is a folder,
+    or an object with a "folder" and other summarize.py options by name ("task_instruction", "exclude_files", ...).
+    Options are parsed like the command line: a root's own options override the defaults, which override the
+    command line. Paths are relative to the manifest. File lists are hidden unless a root sets hide_file_list to false.
+    """
+    data = json.loads(manifest.read_text())
+    defaults, roots = ({}, data) if isinstance(data, list) else (data.get("defaults", {}), data["roots"])
+    # absolute, so the paths match the files that are walked from the folder
+    base = manifest.resolve().parent
+    root_args = []
+    for root in roots:
+        options = {"hide_file_list": True, **defaults, **({"folder": root} if isinstance(root, str) else root)}
+        if "folder" not in options:
+            root_args.append((str(root), "root without a folder"))
+            continue
+        for key in PATH_OPTIONS:
+            value = options.get(key)
+            if isinstance(value, list):
+                options[key] = [str(base / path) for path in value]
+            elif value not in (None, "-"):
+                options[key] = str(base / value)
+
+        namespace = copy.copy(args)
+        namespace.batch = None
+        namespace.hide_file_list = options.pop("hide_file_list")
+        try:
+            namespace = parser.parse_args(option_argv(options), namespace=namespace)
+        except SystemExit:
+            # argparse has printed the error
+            root_args.append((options["folder"], "invalid options"))
+            continue
+        error = option_error(namespace)
+        if error is None and not Path(namespace.folder).is_dir():
+            error = f"{namespace.folder} is not a folder"
+        if error:
+            root_args.append((namespace.folder, error))
+            continue
+        namespace.exclude_files = [Path(path) for path in namespace.exclude_files]
+        root_args.append((namespace.folder, namespace))
+    return root_args
+
+
+def run_batch(args: argparse.Namespace, parser: argparse.ArgumentParser, enc: Encoding) -> None:
+    """
+    Summarizes every root of the --batch manifest in this process, sharing the encoder, the token cache
+    and the tokenizer threads, and prints a timing report per root.
+    """
+    roots = load_roots(Path(args.batch), parser, args)
+    cache = None if args.no_token_cache else TokenCache(Path(args.token_cache))
+    rows = []
+    start = time.perf_counter()
+    with Profile(args.profile_files) if args.profile else nullcontext() as profile:
+        for folder, root in roots:
+            root_start = time.perf_counter()
+            if isinstance(root, str):
+                status, row = f"error: {root}", [folder, "", "", ""]
+            else:
+                try:
+                    result = summarize_files(root, enc, profile, cache)
+                    status = "no files" if not result.files else "up to date" if result.reused else "written"
+                    row = [folder, result.files, result.included, result.tokens]
+                except Exception as e:
+                    status = f"error: {e}"
+                    row = [folder, "", "", ""]
+            rows.append([*row, f"{time.perf_counter() - root_start:.2f}s", status])
+            if cache:
+                cache.commit()
+    seconds = time.perf_counter() - start
+    if cache:
+        cache.close()
+
+    header = ["root", "files", "included", "tokens", "time", "status"]
+    total = ["total", *(sum(row[i] for row in rows if row[i] != "") for i in (1, 2, 3)), f"{seconds:.2f}s", f"{len(rows)} roots"]
+    table = [header, *rows, total]
+    widths = [max(len(str(row[i])) for row in table) for i in range(len(header))]
+    print()
+    for row in table:
+        print("  ".join(
+            str(value).ljust(width) if i in (0, len(row) - 1) else str(value).rjust(width)
+            for i, (value, width) in enumerate(zip(row, widths))
+        ).rstrip())
+    if cache:
+        print(f"\ntoken cache: {cache.hits} hits, {cache.misses} misses")
+    if profile:
+        profile.write(args.profile)
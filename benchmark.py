@@ -0,0 +1,644 @@
+import argparse
+import json
+import math
+import os
+import random
+import shutil
+import signal
+import subprocess
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from file_printing import (
+    FileRecord, SummaryWriter, build_records, directory_outline_compact, directory_outline_full,
+    directory_outline_pretty, iter_records, read_bounded, relative_name, render_section,
+)
+from file_selection import default_rules, global_filter, select_files
+from ignore_rules import IgnoreRules
+from settings import BYTES_PER_TOKEN, ESTIMATE_COVERAGE, SUFFIX_TO_LANGUAGE, TEST_PATTERNS
+from tokenization import batch_size, capped_count, count_tokens, estimate_error, estimate_tokens
+
+
+# cold start of `summarize.py --help` and `--no_tokens`, which must not load the tokenizer
+STARTUP_BUDGET_MS = 250
+
+# languages with fewer measured files than this are too noisy to check the estimate bounds on
+ESTIMATE_MIN_FILES = 20
+
+# suite stages may be this much slower than the baseline (as a fraction), and at least this many seconds
+REGRESSION_THRESHOLD = 0.2
+REGRESSION_MIN_SECONDS = 0.05
+
+WORDS = ["def", "class", "return", "import", "self", "value", "items", "for", "in", "if", "else", "None", "True", "(", ")", ":", "=", "+", "\n", "    "]
+
+
+def make_tree(root: Path, n_files: int, files_per_dir: int = 50, seed: int = 0) -> List[Path]:
+    """
+    Writes a deterministic synthetic project of `n_files` Python files under `root`.
+    """
+    rng = random.Random(seed)
+    files = []
+    for i in range(n_files):
+        directory = root / f"package_{i // files_per_dir:05d}"
+        directory.mkdir(parents=True, exist_ok=True)
+        file = directory / f"module_{i % files_per_dir:03d}.py"
+        file.write_text(" ".join(rng.choice(WORDS) for _ in range(rng.randint(50, 2000))))
+        files.append(file)
+    return files
+
+
+def make_python_tree(root: Path, n_files: int, undocumented: float = 0.05, files_per_dir: int = 50, seed: int = 0) -> List[Path]:
+    """
+    Writes a deterministic synthetic project of `n_files` valid Python modules under `root`, with classes and
+    annotated functions. An `undocumented` fraction of the modules has a function without a docstring.
+    """
+    rng = random.Random(seed)
+    files = []
+    for i in range(n_files):
+        directory = root / f"package_{i // files_per_dir:05d}"
+        directory.mkdir(parents=True, exist_ok=True)
+        missing = rng.randrange(10) if rng.random() < undocumented else None
+        lines = ["import os", ""]
+        for j in range(10):
+            lines += [f"class Model{j}:", '    """A model."""', ""]
+            lines += [f"    def method(self, value: int) -> int:"]
+            lines += [] if j == missing else ['        """Returns the value."""']
+            lines += [f"        return value + {j}" for _ in range(rng.randint(1, 20))] + [""]
+        file = directory / f"module_{i % files_per_dir:03d}.py"
+        file.write_text("\n".join(lines))
+        files.append(file)
+    return files
+
+
+def generate_tree(
+    root: Path,
+    n_files: int,
+    depth: int = 4,
+    files_per_dir: int = 20,
+    languages: Optional[Dict[str, float]] = None,
+    median_bytes: int = 2000,
+    sigma: float = 1.0,
+    decoys: float = 0.2,
+    seed: int = 0,
+) -> List[Path]:
+    """
+    Writes a deterministic synthetic project of `n_files` files under `root` and returns them.
+
+    Directories are nested up to `depth` levels, files get suffixes drawn from `languages` (suffix: weight,
+    all of SUFFIX_TO_LANGUAGE equally by default) and log-normal sizes around `median_bytes`.
+    A `decoys` fraction of the files goes to node_modules/ and venv/ folders, which the default rules skip.
+    The parameters are stored in `root/.bench_tree.json`, an existing tree with the same ones is reused.
+    """
+    languages = languages or {suffix: 1.0 for suffix in SUFFIX_TO_LANGUAGE}
+    params = dict(
+        n_files=n_files, depth=depth, files_per_dir=files_per_dir, languages=languages,
+        median_bytes=median_bytes, sigma=sigma, decoys=decoys, seed=seed,
+    )
+    params_file = root / ".bench_tree.json"
+    if params_file.exists():
+        if json.loads(params_file.read_text()) == params:
+            return [file for file in root.rglob("*") if file.is_file() and file != params_file]
+        shutil.rmtree(root)
+    assert not root.exists(), f"{root} exists and wasn't generated by this benchmark"
+
+    rng = random.Random(seed)
+    corpus = " ".join(rng.choice(WORDS) for _ in range(1 << 20))
+    suffixes, weights = list(languages), list(languages.values())
+    n_dirs = max(1, n_files // files_per_dir)
+    directories = [
+        Path(*(f"dir_{rng.randrange(8)}" for _ in range(rng.randint(0, depth - 1))), f"package_{i:06d}")
+        for i in range(n_dirs)
+    ]
+
+    files = []
+    for i in range(n_files):
+        directory = root / rng.choice(directories)
+        if rng.random() < decoys:
+            decoy = rng.choice([Path("node_modules", f"lib_{i % 97}"), Path("venv", "lib", "site-packages", f"lib_{i % 89}")])
+            directory = root / decoy if rng.random() < 0.5 else directory / decoy
+        directory.mkdir(parents=True, exist_ok=True)
+        suffix = rng.choices(suffixes, weights)[0]
+        size = min(len(corpus), int(rng.lognormvariate(math.log(median_bytes), sigma)))
+        start = rng.randrange(len(corpus) - size + 1)
+        file = directory / f"file_{i:07d}{suffix}"
+        file.write_text(corpus[start:start+size])
+        files.append(file)
+    params_file.write_text(json.dumps(params))
+    return files
+
+
+def timed(stages: Dict[str, dict], name: str, function: Callable, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    stages[name] = dict(seconds=time.perf_counter() - start)
+    return result
+
+
+def bench_stages(folder: Path, enc, workers: int) -> Dict[str, dict]:
+    """
+    Times every stage of a summarize.py run on `folder`.
+    Reading and token counting are done in batches like `iter_records` does, and timed separately.
+    """
+    stages = {}
+    files, walked = timed(stages, "walk", select_files, folder, filters=[], prune=True, rules=default_rules(folder))
+    timed(stages, "global_filter", lambda: [global_filter(file, is_dir=False) for file in walked])
+
+    read_seconds = tokenize_seconds = 0.0
+    records = []
+    size = batch_size(workers)
+    for start in range(0, len(files), size):
+        batch = files[start:start+size]
+        read_start = time.perf_counter()
+        names = [relative_name(file, folder) for file in batch]
+        sections = []
+        for file, name in zip(batch, names):
+            content, _ = read_bounded(file, name)
+            sections.append(render_section(file, name, content) if content is not None else "")
+        tokenize_start = time.perf_counter()
+        counts = count_tokens(sections, enc, workers)
+        read_seconds += tokenize_start - read_start
+        tokenize_seconds += time.perf_counter() - tokenize_start
+        records.extend(FileRecord(file, name, None, "", tokens) for file, name, tokens in zip(batch, names, counts))
+    stages["read"] = dict(seconds=read_seconds)
+    stages["tokenize"] = dict(seconds=tokenize_seconds)
+
+    for name, outline in (
+        ("outline_full", directory_outline_full),
+        ("outline_pretty", directory_outline_pretty),
+        ("outline_compact", directory_outline_compact),
+    ):
+        timed(stages, name, outline, files, folder, enc, records=records)
+
+    def write_summary():
+        with open(os.devnull, "w") as out:
+            writer = SummaryWriter(out, folder, enc)
+            for record in iter_records(files, folder, enc, workers=workers):
+                writer.write(record)
+            writer.finish("", "")
+    timed(stages, "summary", write_summary)
+
+    for name, stage in stages.items():
+        stage["items"] = len(walked) if name in ("walk", "global_filter") else len(files)
+    return stages
+
+
+def bench_suite(folder: Path, enc, workers: int, repeat: int = 1) -> dict:
+    """
+    Runs `bench_stages` `repeat` times and keeps the fastest time of each stage, which is the least noisy.
+    """
+    runs = [bench_stages(folder, enc, workers) for _ in range(repeat)]
+    stages = {name: min((run[name] for run in runs), key=lambda stage: stage["seconds"]) for name in runs[0]}
+    for name, stage in stages.items():
+        print(f"{name:<16} items={stage['items']:<8} {stage['seconds']:8.3f}s")
+    return dict(workers=workers, repeat=repeat, stages=stages)
+
+
+def compare(results: dict, baseline: dict, threshold: float = REGRESSION_THRESHOLD) -> List[str]:
+    """
+    Prints each stage next to the baseline and returns the stages that got slower than `threshold` allows.
+    """
+    assert results["params"] == baseline["params"], "the baseline was measured on another synthetic tree"
+    regressions = []
+    for name, stage in results["stages"].items():
+        if name not in baseline["stages"]:
+            continue
+        before, after = baseline["stages"][name]["seconds"], stage["seconds"]
+        print(f"{name:<16} {before:8.3f}s -> {after:8.3f}s ({after / before if before else math.inf:.2f}x)")
+        if after > before * (1 + threshold) and after - before > REGRESSION_MIN_SECONDS:
+            regressions.append(name)
+    return regressions
+
+
+def language_weight(value: str):
+    suffix, _, weight = value.rpartition("=")
+    return suffix if suffix.startswith(".") or not suffix else f".{suffix}", float(weight)
+
+
+def bench_walk(folder: Path) -> None:
+    """
+    Times `select_files` and checks that it doesn't stat every walked file.
+    """
+    stat_calls = 0
+    os_stat = os.stat
+
+    def counting_stat(*args, **kwargs):
+        nonlocal stat_calls
+        stat_calls += 1
+        return os_stat(*args, **kwargs)
+
+    os.stat = counting_stat
+    try:
+        start = time.perf_counter()
+        _, all_files = select_files(folder, filters=[global_filter])
+        seconds = time.perf_counter() - start
+    finally:
+        os.stat = os_stat
+    print(f"walk files={len(all_files)} stat_calls={stat_calls} {seconds:.2f}s")
+    assert stat_calls < len(all_files) // 10 + 10, "select_files stats (almost) every file"
+
+
+def bench_match(n_paths: int = 1_000_000, seed: int = 0) -> None:
+    """
+    Times the compiled default ignore rules, plus some typical .gitignore patterns, on `n_paths` paths.
+    """
+    rng = random.Random(seed)
+    names = ["src", "lib", "app", "node_modules", "venv", "tests", "migrations", "dist", ".cache", "core"]
+    suffixes = [".py", ".js", ".ts", ".md", ".json", ".log", ".pyc", ""]
+    paths = [
+        "/".join(rng.choice(names) for _ in range(rng.randint(0, 6))) + f"/file_{i}{rng.choice(suffixes)}"
+        for i in range(n_paths)
+    ]
+    rules = default_rules(Path(), patterns=["*.log", "!important.log", "/build/", "**/generated/**", "*.min.js"])
+    start = time.perf_counter()
+    ignored = sum(rules.ignored(path, False) for path in paths)
+    seconds = time.perf_counter() - start
+    print(f"match paths={n_paths} ignored={ignored} {seconds:.2f}s ({n_paths / seconds / 1e6:.2f}M paths/s)")
+
+    tests = IgnoreRules(Path(), patterns=TEST_PATTERNS, ignore_files=())
+    for path in ["test_api.py", "src/api_test.go", "tests/helpers.py", "src/test/fixtures/data.json"]:
+        assert tests.ignored(path, False), f"--filter_tests keeps {path}"
+    assert not tests.ignored("src/api.py", False), "--filter_tests drops src/api.py"
+
+
+def bench_tokenize(folder: Path, enc, workers: int) -> None:
+    files, _ = select_files(folder, filters=[global_filter])
+    timings, results = {}, {}
+    for n in sorted({1, workers}):
+        start = time.perf_counter()
+        results[n] = [record.tokens for record in build_records(files, folder, enc, workers=n)]
+        timings[n] = time.perf_counter() - start
+    assert results[1] == results[workers], "parallel token counts differ from sequential ones"
+    for n, seconds in timings.items():
+        print(f"workers={n:<3} files={len(files)} {seconds:.2f}s ({timings[1] / seconds:.1f}x)")
+
+
+def bench_memory(folder: Path, enc, n_files: int, workers: int) -> None:
+    """
+    Streams the summary of a project and one ten times as large, and checks that the peak memory
+    doesn't grow with the size of the file contents.
+    """
+    peaks = {}
+    for n in (n_files // 10, n_files):
+        root = folder.with_name(f"{folder.name}_memory_{n}")
+        if not root.exists():
+            make_tree(root, n)
+        files, _ = select_files(root, filters=[global_filter])
+        source_bytes = sum(file.stat().st_size for file in files)
+
+        tracemalloc.start()
+        with open(os.devnull, "w") as out:
+            writer = SummaryWriter(out, root, enc)
+            counts = []
+            for record in iter_records(files, root, enc, workers=workers):
+                writer.write(record)
+                counts.append((record.name, record.tokens))
+            writer.finish("", "")
+        _, peaks[n] = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"memory files={n} source={source_bytes / 1e6:.1f}MB peak={peaks[n] / 1e6:.1f}MB")
+
+    small, large = peaks[n_files // 10], peaks[n_files]
+    assert large < 2 * small, "peak memory grows with the size of the project"
+
+
+def bench_docstrings(folder: Path, n_files: int, workers: int) -> None:
+    """
+    Times `add_docstrings` in dry run mode on a Python project against parsing every file with libcst,
+    with one process and with `workers`.
+    """
+    import libcst
+    from contextlib import redirect_stdout
+    from docstring_annotation import add_docstrings
+
+    root = folder.with_name(f"{folder.name}_docstrings_{n_files}")
+    files = sorted(root.rglob("*.py")) if root.exists() else make_python_tree(root, n_files)
+    start = time.perf_counter()
+    for file in files:
+        libcst.MetadataWrapper(libcst.parse_module(file.read_text()))
+    print(f"docstrings parse_all files={len(files)} {time.perf_counter() - start:.2f}s")
+    for n in sorted({1, workers}):
+        start = time.perf_counter()
+        with open(os.devnull, "w") as out, redirect_stdout(out):
+            changed = add_docstrings(files, workers=n, dry_run=True)
+        print(f"docstrings workers={n:<3} files={len(files)} changed={len(changed)} {time.perf_counter() - start:.2f}s")
+
+
+def bench_skeleton(folder: Path, enc, n_files: int) -> None:
+    """
+    Times `skeleton` on a Python project and reports the tokens it saves. Also checks the file list of a
+    --skeleton run without any Python file, where no file has savings.
+    """
+    from pipeline import info_table
+    from skeleton import skeleton
+
+    root = folder.with_name(f"{folder.name}_docstrings_{n_files}")
+    files = sorted(root.rglob("*.py")) if root.exists() else make_python_tree(root, n_files)
+    sources = [file.read_text() for file in files]
+    start = time.perf_counter()
+    skeletons = [skeleton(source) for source in sources]
+    seconds = time.perf_counter() - start
+    full = sum(len(enc.encode_ordinary(source)) for source in sources)
+    short = sum(len(enc.encode_ordinary(text)) for text in skeletons)
+    print(f"skeleton files={len(files)} {seconds:.2f}s tokens={full} skeleton={short} ({1 - short / max(1, full):.0%} saved)")
+
+    table = info_table(["README.md", "data.json"], [10, 20], [True, True], 30, [], savings=[None, None])
+    assert "saved by --skeleton: 0" in table, "file list without skeletons is wrong"
+
+
+def bench_estimate(folder: Path, enc, cap: int = 1000) -> None:
+    """
+    Measures the token estimates against tiktoken on the files of a real project: the bytes per token and
+    the share of files within the error bound of each language, and checks that it's at least ESTIMATE_COVERAGE
+    for the languages with ESTIMATE_MIN_FILES files or more.
+    Also checks that capped counts are exact below the cap and over it above.
+    """
+    files, _ = select_files(folder, filters=[global_filter], prune=True, rules=default_rules(folder))
+    by_language: Dict[str, List[tuple]] = {}
+    for file in files:
+        content, truncated = read_bounded(file, file)
+        if content is None or truncated or not content.strip():
+            continue
+        tokens = len(enc.encode_ordinary(content))
+        language = SUFFIX_TO_LANGUAGE.get(file.suffix, "")
+        size = len(content.encode("utf-8"))
+        by_language.setdefault(language, []).append((file, size, tokens))
+        capped = capped_count(content, enc, cap)
+        assert capped == tokens if tokens <= cap else capped > cap, f"capped count of {file} is wrong"
+
+    print(f"{'language':<12} {'files':>6} {'bytes/token':>12} {'configured':>11} {'bound':>6} {'within':>7}")
+    below = []
+    for language, measured in sorted(by_language.items()):
+        suffix = measured[0][0].suffix
+        error = estimate_error(suffix)
+        ratio = sum(size for _, size, _ in measured) / max(1, sum(tokens for _, _, tokens in measured))
+        configured = BYTES_PER_TOKEN.get(language, BYTES_PER_TOKEN[""])[0]
+        if error is None:
+            print(f"{language or 'other':<12} {len(measured):>6} {ratio:>12.2f} {configured:>11.2f} {'-':>6} {'-':>7}")
+            continue
+        within = sum(abs(estimate_tokens(size, suffix) - tokens) <= error * tokens for _, size, tokens in measured) / len(measured)
+        print(f"{language or 'other':<12} {len(measured):>6} {ratio:>12.2f} {configured:>11.2f} {error:>6.0%} {within:>7.0%}")
+        if within < ESTIMATE_COVERAGE and len(measured) >= ESTIMATE_MIN_FILES:
+            below.append(f"{language or 'other'} ({within:.0%})")
+    assert not below, f"fewer than {ESTIMATE_COVERAGE:.0%} of the files are within the estimate bound: {', '.join(below)}"
+
+
+def bench_relevance(folder: Path, n_files: int, terms_per_file: int = 200, queries: int = 20, seed: int = 0) -> None:
+    """
+    Times --embeddings_selection queries on an index of `n_files` synthetic files with Zipf-distributed terms,
+    loaded memory-mapped like a run does.
+    """
+    import numpy as np
+    from embeddings import DIMENSIONS, RelevanceIndex
+
+    directory = folder.with_name(f"{folder.name}_relevance_{n_files}")
+    index = RelevanceIndex(directory)
+    if len(index.names) != n_files:
+        rng = np.random.default_rng(seed)
+        sizes = rng.integers(terms_per_file // 2, terms_per_file * 2, n_files)
+        rows = [np.unique(rng.zipf(1.3, size) % DIMENSIONS).astype(np.int32) for size in sizes]
+        sizes = np.array([len(row) for row in rows])
+        index.names = [f"package_{i // 50:05d}/module_{i % 50:03d}.py" for i in range(n_files)]
+        index.stats = [None] * n_files
+        index.arrays = {
+            "offsets": np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64),
+            "buckets": np.concatenate(rows),
+            "counts": rng.integers(1, 20, sizes.sum()).astype(np.float32),
+        }
+        start = time.perf_counter()
+        index.arrays.update(index._postings(sizes))
+        index.save()
+        print(f"relevance build files={n_files} postings={sizes.sum()} {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    index = RelevanceIndex(directory)
+    print(f"relevance load {(time.perf_counter() - start) * 1000:.1f}ms")
+    words = ["token", "cache", "evict", "watch", "inotify", "budget", "select", "files", "summary", "parse", "model", "value"]
+    rng = random.Random(seed)
+    times = []
+    for _ in range(queries):
+        query = " ".join(rng.sample(words, 5))
+        start = time.perf_counter()
+        index.top(query, 20)
+        times.append(time.perf_counter() - start)
+    print(f"relevance query files={n_files} median={sorted(times)[queries // 2] * 1000:.1f}ms max={max(times) * 1000:.1f}ms")
+
+
+def make_import_tree(root: Path, n_files: int, imports: int = 8, files_per_dir: int = 50, seed: int = 0) -> List[Path]:
+    """
+    Writes a deterministic synthetic project of `n_files` Python and TypeScript modules under `root`,
+    each importing `imports` other modules of its language.
+    """
+    rng = random.Random(seed)
+    files = []
+    for i in range(n_files):
+        package = f"package_{i // files_per_dir:05d}"
+        (root / package).mkdir(parents=True, exist_ok=True)
+        if i % 2:
+            targets = [rng.randrange(1, n_files, 2) for _ in range(imports)]
+            lines = [f'import {{ f }} from "../package_{j // files_per_dir:05d}/module_{j % files_per_dir:03d}";' for j in targets]
+            file = root / package / f"module_{i % files_per_dir:03d}.ts"
+        else:
+            targets = [rng.randrange(0, n_files, 2) for _ in range(imports)]
+            lines = [f"from package_{j // files_per_dir:05d}.module_{j % files_per_dir:03d} import f" for j in targets]
+            file = root / package / f"module_{i % files_per_dir:03d}.py"
+        file.write_text("\n".join(lines + ["", "def f(x):", "    return x"]))
+        files.append(file)
+    return files
+
+
+def bench_imports(folder: Path, n_files: int) -> None:
+    """
+    Builds the --seed import graph of a project and one four times as large, from scratch and from the cache,
+    and checks that the build time grows linearly with the number of files.
+    """
+    from import_graph import ImportGraph
+
+    seconds = {}
+    for n in (n_files // 4, n_files):
+        root = folder.with_name(f"{folder.name}_imports_{n}")
+        files = sorted(root.rglob("module_*")) if root.exists() else make_import_tree(root, n)
+        cache = root.with_name(f"{root.name}.json")
+        cache.unlink(missing_ok=True)
+        for run in ("cold", "warm"):
+            graph = ImportGraph(cache)
+            start = time.perf_counter()
+            graph.update(files, root)
+            seconds[n, run] = time.perf_counter() - start
+            edges = sum(map(len, graph.edges.values()))
+            print(f"imports {run} files={n} edges={edges} {seconds[n, run]:.2f}s ({seconds[n, run] / n * 1e6:.0f}us/file)")
+    for run in ("cold", "warm"):
+        growth = seconds[n_files, run] / seconds[n_files // 4, run]
+        assert growth < 4 * 1.5, f"{run} import graph build grows {growth:.1f}x for 4x the files"
+
+
+def bench_library(folder: Path, enc, n_files: int, changed: int = 10) -> None:
+    """
+    Times a cold `Summarizer.render` of a synthetic project, then a refresh and render after touching
+    `changed` files, and checks that the warm refresh only reads the changed files.
+    """
+    from summarizer import Summarizer
+
+    root = folder.with_name(f"{folder.name}_library")
+    files = sorted(root.rglob("module_*")) if root.exists() else make_tree(root, n_files)
+    with Summarizer(root, enc=enc, no_token_cache=True, output=str(root / "summary.txt")) as summarizer:
+        start = time.perf_counter()
+        summarizer.render()
+        cold = time.perf_counter() - start
+        for file in files[:changed]:
+            file.write_text(file.read_text() + "\n")
+        records = dict(summarizer.records)
+        start = time.perf_counter()
+        summarizer.refresh()
+        summarizer.render()
+        warm = time.perf_counter() - start
+        read = sum(summarizer.records[file] is not records.get(file) for file in summarizer.selection.files)
+    print(f"library files={len(files)} cold={cold:.2f}s warm={warm:.2f}s ({changed} changed, {read} read)")
+    assert read == changed, f"refresh read {read} files, {changed} changed"
+
+
+def bench_watch(folder: Path, n_files: int, settle: float = 3.0) -> None:
+    """
+    Runs summarize.py --watch on a synthetic project, with a relative --folder and an absolute --output,
+    edits one file and checks that it's summarized again exactly once: the watcher's own writes of the
+    summary aren't changes.
+    """
+    root = folder.with_name(f"{folder.name}_watch")
+    files = sorted(root.rglob("module_*")) if root.exists() else make_tree(root, n_files)
+    script = Path(__file__).resolve().with_name("summarize.py")
+    # outside of the folder, or writing it would be a change
+    log = root.with_name(f"{root.name}.log")
+    with open(log, "w") as out:
+        process = subprocess.Popen(
+            [sys.executable, "-u", str(script), "--folder", root.name, "--output", str((root / "summary.txt").resolve()),
+             "--watch", "--no_token_cache", "--hide_file_list"],
+            cwd=root.parent, stdout=out, stderr=subprocess.STDOUT,
+        )
+    try:
+        start = time.perf_counter()
+        while "watching" not in log.read_text():
+            assert process.poll() is None, f"summarize.py --watch exited:\n{log.read_text()}"
+            assert time.perf_counter() - start < 60, "summarize.py --watch didn't start within 60s"
+            time.sleep(0.1)
+        files[0].write_text(files[0].read_text() + "\n")
+        time.sleep(settle)
+    finally:
+        process.send_signal(signal.SIGINT)
+        process.wait(timeout=10)
+    regenerations = sum(" changed, " in line for line in log.read_text().splitlines())
+    print(f"watch files={len(files)} regenerations={regenerations} after one edit")
+    assert regenerations == 1, f"one edit was summarized {regenerations} times"
+
+
+def bench_startup(runs: int = 5) -> None:
+    """
+    Times cold starts of summarize.py in fresh interpreters, for `--help` and for `--no_tokens` on this folder.
+    Checks that neither imports tiktoken and that the median stays within STARTUP_BUDGET_MS.
+    """
+    script = Path(__file__).resolve().with_name("summarize.py")
+    for name, argv in [("help", ["--help"]), ("no_tokens", ["--folder", str(script.parent), "--no_tokens"])]:
+        times = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, str(script), *argv], capture_output=True, check=True)
+            times.append(time.perf_counter() - start)
+        median = sorted(times)[runs // 2] * 1000
+
+        # `-X importtime` lines end with "| <cumulative us> | <module>"
+        stderr = subprocess.run(
+            [sys.executable, "-X", "importtime", str(script), *argv], capture_output=True, text=True, check=True,
+        ).stderr
+        imports = [line.split("|") for line in stderr.splitlines() if line.startswith("import time:")]
+        slowest = sorted(imports[1:], key=lambda columns: -int(columns[1]))[:3]
+        print(f"startup {name} median={median:.0f}ms slowest imports: " + ", ".join(
+            f"{columns[2].strip()} {int(columns[1]) / 1000:.0f}ms" for columns in slowest
+        ))
+        assert not any(columns[2].strip() == "tiktoken" for columns in imports), f"{name} imports tiktoken"
+        assert median < STARTUP_BUDGET_MS, f"{name} starts in {median:.0f}ms, budget {STARTUP_BUDGET_MS}ms"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the summarize.py pipeline on a synthetic project.')
+    parser.add_argument('benchmark', choices=["walk", "match", "tokenize", "memory", "startup", "suite", "docstrings", "estimate", "relevance", "imports", "library", "skeleton", "watch"], help='benchmark to run')
+    parser.add_argument('--folder', type=str, default="bench_tree", help='folder in which the synthetic project is generated')
+    parser.add_argument('--files', type=int, default=50_000, help='number of files in the synthetic project')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='number of threads used to count tokens')
+    parser.add_argument('--depth', type=int, default=4, help='suite: maximum directory depth of the synthetic project')
+    parser.add_argument('--languages', nargs='*', type=language_weight, default=[], help='suite: SUFFIX=WEIGHT pairs, e.g. py=3 js=1 (default: every suffix in SUFFIX_TO_LANGUAGE)')
+    parser.add_argument('--median_bytes', type=int, default=2000, help='suite: median file size')
+    parser.add_argument('--decoys', type=float, default=0.2, help='suite: fraction of files in node_modules/ and venv/ folders')
+    parser.add_argument('--seed', type=int, default=0, help='suite: seed of the synthetic project')
+    parser.add_argument('--repeat', type=int, default=1, help='suite: number of runs, the fastest time of each stage is kept')
+    parser.add_argument('--results', type=str, default=None, help='suite: JSON file to write the results to')
+    parser.add_argument('--baseline', type=str, default=None, help='suite: JSON results of an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD, help='suite: fraction by which a stage may be slower than the baseline')
+    args = parser.parse_args()
+
+    if args.benchmark == "match":
+        bench_match()
+        exit()
+    if args.benchmark == "startup":
+        bench_startup()
+        exit()
+    if args.benchmark == "docstrings":
+        bench_docstrings(Path(args.folder), args.files, args.workers)
+        exit()
+    if args.benchmark == "relevance":
+        bench_relevance(Path(args.folder), args.files)
+        exit()
+    if args.benchmark == "imports":
+        bench_imports(Path(args.folder), args.files)
+        exit()
+    if args.benchmark == "watch":
+        bench_watch(Path(args.folder), args.files)
+        exit()
+
+    folder = Path(args.folder)
+    if args.benchmark == "walk":
+        if not folder.exists():
+            make_tree(folder, args.files)
+        bench_walk(folder)
+        exit()
+
+    # the remaining benchmarks count tokens
+    from summarize import get_encoding
+    enc = get_encoding()
+
+    if args.benchmark == "estimate":
+        # real code: this repository, unless another folder is given
+        bench_estimate(folder if args.folder != parser.get_default("folder") else Path(__file__).resolve().parent, enc)
+        exit()
+    if args.benchmark == "skeleton":
+        bench_skeleton(folder, enc, args.files)
+        exit()
+    if args.benchmark == "library":
+        bench_library(folder, enc, args.files)
+        exit()
+    if args.benchmark == "suite":
+        root = folder.with_name(f"{folder.name}_suite")
+        params = dict(
+            depth=args.depth, languages=dict(args.languages) or None, median_bytes=args.median_bytes,
+            decoys=args.decoys, seed=args.seed,
+        )
+        start = time.perf_counter()
+        generate_tree(root, args.files, **params)
+        print(f"tree {root} files={args.files} {time.perf_counter() - start:.2f}s")
+        results = dict(params=json.loads((root / ".bench_tree.json").read_text()), **bench_suite(root, enc, args.workers, args.repeat))
+        if args.results:
+            Path(args.results).write_text(json.dumps(results, indent=2))
+        if args.baseline:
+            regressions = compare(results, json.loads(Path(args.baseline).read_text()), args.threshold)
+            assert not regressions, f"slower than the baseline: {', '.join(regressions)}"
+        exit()
+
+    if args.benchmark == "memory":
+        bench_memory(folder, enc, args.files, args.workers)
+        exit()
+
+    if not folder.exists():
+        make_tree(folder, args.files)
+
+    if args.benchmark == "tokenize":
+        bench_tokenize(folder, enc, args.workers)
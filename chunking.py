@@ -0,0 +1,90 @@
+import ast
+from typing import Callable, List, Tuple
+
+from skeleton import SKELETON_SUFFIXES
+
+
+# characters that open and close blocks in brace languages
+OPENERS, CLOSERS = "{([", "})]"
+
+
+def python_boundaries(content: str) -> List[Tuple[int, int]]:
+    """
+    Returns (line, depth) pairs of the lines where Python definitions and statements start: depth 0 for
+    the module's statements, 1 for the statements in a class body. Decorators belong to their definition.
+    """
+    try:
+        module = ast.parse(content)
+    except (SyntaxError, ValueError):
+        return []
+
+    def start(node: ast.stmt) -> int:
+        return min([node.lineno, *(decorator.lineno for decorator in getattr(node, "decorator_list", []))]) - 1
+
+    boundaries = []
+    for node in module.body:
+        boundaries.append((start(node), 0))
+        if isinstance(node, ast.ClassDef):
+            boundaries.extend((start(child), 1) for child in node.body)
+    return boundaries
+
+
+def brace_boundaries(content: str) -> List[Tuple[int, int]]:
+    """
+    Returns (line, depth) pairs of the lines where a block or statement likely starts, by brace depth:
+    unindented lines outside of braces (depth 0), and lines one brace deep that follow a line ending at
+    that depth (depth 1, like the methods of a class). Brackets in strings and comments aren't recognized.
+    """
+    boundaries = []
+    depth, previous_end = 0, 0
+    for i, line in enumerate(content.split("\n")):
+        stripped = line.strip()
+        if stripped and stripped[0] not in CLOSERS:
+            if depth == 0 and not line[0].isspace():
+                boundaries.append((i, 0))
+            elif depth == 1 and previous_end == 1:
+                boundaries.append((i, 1))
+        depth = max(0, depth + sum(line.count(c) for c in OPENERS) - sum(line.count(c) for c in CLOSERS))
+        if stripped:
+            previous_end = depth
+    return boundaries
+
+
+def split_definitions(content: str, suffix: str, max_tokens: int, count: Callable[[str], int]) -> List[str]:
+    """
+    Splits `content` into consecutive chunks of at most `max_tokens` tokens (as counted by `count`) that
+    start at definition boundaries (see `python_boundaries` and `brace_boundaries`): between top-level
+    definitions if they fit, else between the members of a definition, and between lines only for a
+    single member that doesn't fit on its own. A single line that doesn't fit is a chunk of its own.
+    Joining the chunks with newlines gives `content` back.
+    """
+    lines = content.split("\n")
+    boundaries = python_boundaries(content) if suffix in SKELETON_SUFFIXES else brace_boundaries(content)
+
+    def units(start: int, end: int, depth: int) -> List[Tuple[str, int]]:
+        # the text of lines start to end, as (text, tokens) pieces that each fit, cut at boundaries of `depth` or deeper
+        text = "\n".join(lines[start:end])
+        tokens = count(text)
+        if tokens <= max_tokens or end - start == 1:
+            return [(text, tokens)]
+        if depth <= 1:
+            cuts = [line for line, line_depth in boundaries if line_depth == depth and start < line < end]
+            if not cuts:
+                return units(start, end, depth + 1)
+        else:
+            # a single definition that doesn't fit: every line is a boundary
+            cuts = list(range(start + 1, end))
+        edges = [start, *cuts, end]
+        return [unit for a, b in zip(edges, edges[1:]) for unit in units(a, b, depth + 1)]
+
+    chunks, chunk, chunk_tokens = [], [], 0
+    for text, tokens in units(0, len(lines), 0):
+        # the newline that joins two pieces is (nearly always) a token of its own
+        if chunk and chunk_tokens + 1 + tokens > max_tokens:
+            chunks.append("\n".join(chunk))
+            chunk, chunk_tokens = [], 0
+        chunk_tokens += tokens + (1 if chunk else 0)
+        chunk.append(text)
+    if chunk:
+        chunks.append("\n".join(chunk))
+    return chunks
@@ -1,7 +1,16 @@
-import libcst as cst
-from libcst.metadata import PositionProvider
-from typing import List, Union
+import argparse
+import ast
+import difflib
+import os
+import shutil
+import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import List, Optional, Tuple, Union
+
+import libcst as cst
+
+from file_selection import default_rules, python_files_only, select_files
 
 def generate_function_docstring_with_gpt(node: cst.FunctionDef) -> str:
     # Implement your GPT-based docstring generator here
@@ -11,35 +20,140 @@ def generate_class_docstring_with_gpt(node: cst.ClassDef) -> str:
     # Implement your GPT-based docstring generator here
     return "This is a class docstring generated with GPT!"
 
+def has_docstring(body: cst.BaseSuite) -> bool:
+    first_statement = body.body[0] if body.body else None
+    return isinstance(first_statement, cst.SimpleStatementLine) and isinstance(first_statement.body[0], cst.Expr) and isinstance(first_statement.body[0].value, cst.SimpleString)
+
+def with_docstring(body: cst.BaseSuite, docstring: str) -> cst.IndentedBlock:
+    docstring_line = cst.SimpleStatementLine([cst.Expr(cst.SimpleString(f'"""{docstring}"""'))])
+    if isinstance(body, cst.SimpleStatementSuite):
+        # `def f(): return 1` becomes an indented block
+        return cst.IndentedBlock([docstring_line, cst.SimpleStatementLine(body.body)])
+    return body.with_changes(body=[docstring_line, *body.body])
+
+def needs_docstring(node: cst.FunctionDef) -> bool:
+    # functions are documented once they have a return annotation
+    return node.returns is not None
+
 class DocstringTransformer(cst.CSTTransformer):
     def leave_FunctionDef(self, original_node: cst.FunctionDef, updated_node: cst.FunctionDef) -> cst.FunctionDef:
-        if original_node.returns:
-            first_statement = original_node.body.body[0] if original_node.body.body else None
-            if not (isinstance(first_statement, cst.SimpleStatementLine) and isinstance(first_statement.body[0], cst.Expr) and isinstance(first_statement.body[0].value, cst.SimpleString)):
-                docstring = generate_function_docstring_with_gpt(original_node)
-                return updated_node.with_changes(body=cst.IndentedBlock([cst.SimpleStatementLine([cst.Expr(cst.SimpleString(f'"""{docstring}"""'))])].extend(updated_node.body.body)))
-        return original_node
+        if needs_docstring(original_node) and not has_docstring(original_node.body):
+            docstring = generate_function_docstring_with_gpt(original_node)
+            return updated_node.with_changes(body=with_docstring(updated_node.body, docstring))
+        return updated_node
 
     def leave_ClassDef(self, original_node: cst.ClassDef, updated_node: cst.ClassDef) -> cst.ClassDef:
-        first_statement = original_node.body.body[0] if original_node.body.body else None
-        if not (isinstance(first_statement, cst.SimpleStatementLine) and isinstance(first_statement.body[0], cst.Expr) and isinstance(first_statement.body[0].value, cst.SimpleString)):
+        if not has_docstring(original_node.body):
             docstring = generate_class_docstring_with_gpt(original_node)
-            return updated_node.with_changes(body=cst.IndentedBlock([cst.SimpleStatementLine([cst.Expr(cst.SimpleString(f'"""{docstring}"""'))])].extend(updated_node.body.body)))
-        return original_node
-
-def add_docstrings(file: Union[Path, List[Path]]) -> None:
-    if isinstance(file, list):
-        for path in file:
-            add_docstrings(path)
-        return
-
-    assert file.is_file(), f"add_docstrings(): {file} is not a file"
-    assert file.suffix == '.py', f"add_docstrings():{file} is not a Python file"
-    
-    source = file.read_text()
-    tree = cst.parse_module(source)
-    wrapper = cst.MetadataWrapper(tree)
-    transformed_tree = wrapper.visit(DocstringTransformer())
-    
-    modified_source = transformed_tree.code
-    file.write_text(modified_source)
\ No newline at end of file
+            return updated_node.with_changes(body=with_docstring(updated_node.body, docstring))
+        return updated_node
+
+def missing_docstrings(source: str) -> bool:
+    """
+    Cheap pre-screen with the stdlib parser: whether any class, or function that `needs_docstring`, lacks a docstring.
+    Files it can't parse are left to libcst.
+    """
+    if "def " not in source and "class " not in source:
+        return False
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return True
+    for node in ast.walk(tree):
+        if isinstance(node, ast.ClassDef) or (isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.returns):
+            first_statement = node.body[0]
+            if not (isinstance(first_statement, ast.Expr) and isinstance(first_statement.value, ast.Constant) and isinstance(first_statement.value.value, str)):
+                return True
+    return False
+
+def annotate_source(source: str) -> str:
+    if not missing_docstrings(source):
+        return source
+    return cst.parse_module(source).visit(DocstringTransformer()).code
+
+def write_atomically(file: Path, text: str) -> None:
+    temporary = file.with_name(f".{file.name}.{os.getpid()}.tmp")
+    try:
+        with open(temporary, "w", newline="") as f:
+            f.write(text)
+        shutil.copymode(file, temporary)
+        os.replace(temporary, file)
+    finally:
+        if temporary.exists():
+            temporary.unlink()
+
+def annotate_file(file: Path, dry_run: bool = False) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Adds the missing docstrings to `file`, which is only rewritten if it changes.
+    Returns (changes, error): changes are None when the file doesn't change, else the diff of the changes with
+    `dry_run` (the file is left as is) or "" without; error is why the file couldn't be parsed, if it couldn't.
+    """
+    with open(file, newline="") as f:
+        source = f.read()
+    try:
+        annotated = annotate_source(source)
+    except cst.ParserSyntaxError as e:
+        return None, e.message
+    if annotated == source:
+        return None, None
+    if dry_run:
+        return "".join(difflib.unified_diff(
+            source.splitlines(keepends=True), annotated.splitlines(keepends=True), str(file), str(file),
+        )), None
+    write_atomically(file, annotated)
+    return "", None
+
+def add_docstrings(file: Union[Path, List[Path]], workers: Optional[int] = None, dry_run: bool = False) -> List[Path]:
+    """
+    Adds docstrings to a Python file or list of files and returns the files that changed (or would, with `dry_run`).
+    Files are annotated on `workers` processes (default: one per CPU), see `annotate_file`.
+    With `dry_run` the diffs are printed instead of written. Files that don't parse are left as they are,
+    and listed on stderr at the end.
+    """
+    files = file if isinstance(file, list) else [file]
+    for path in files:
+        assert path.is_file(), f"add_docstrings(): {path} is not a file"
+        assert path.suffix == '.py', f"add_docstrings():{path} is not a Python file"
+
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(files) > 1:
+        with ProcessPoolExecutor(workers) as pool:
+            chunksize = max(1, len(files) // (workers * 4))
+            results = list(pool.map(annotate_file, files, [dry_run] * len(files), chunksize=chunksize))
+    else:
+        results = [annotate_file(path, dry_run) for path in files]
+
+    changed, failed = [], []
+    for path, (diff, error) in zip(files, results):
+        if error is not None:
+            failed.append(f"{path}: {error}")
+        elif diff is not None:
+            changed.append(path)
+            if diff:
+                print(diff, end="")
+    if failed:
+        print(f"{len(failed)} files couldn't be parsed:", *failed, sep="\n  ", file=sys.stderr)
+    return changed
+
+def python_files(paths: List[Path]) -> List[Path]:
+    """
+    Returns the files in `paths`, and the Python files below the folders in `paths` that the default rules don't skip.
+    """
+    files = []
+    for path in paths:
+        if path.is_dir():
+            files.extend(select_files(path, filters=[python_files_only], prune=True, rules=default_rules(path))[0])
+        else:
+            files.append(path)
+    return files
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Add missing docstrings to Python files.')
+    parser.add_argument('paths', nargs='+', type=Path, help='Python files, or folders to annotate the Python files of')
+    parser.add_argument('--dry_run', default=False, action="store_true", help='print the changes as a diff instead of writing them')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='number of processes parsing files')
+    args = parser.parse_args()
+    files = python_files(args.paths)
+    changed = add_docstrings(files, args.workers, args.dry_run)
+    print(f"{len(changed)} of {len(files)} files {'would change' if args.dry_run else 'changed'}")
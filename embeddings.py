@@ -0,0 +1,170 @@
+import json
+import math
+import os
+import re
+import shutil
+import zlib
+from collections import Counter
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from file_printing import read_bounded, relative_name
+
+
+# number of hash buckets of the term vectors
+DIMENSIONS = 1 << 18
+WORD_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+# parts of snake_case and camelCase identifiers
+PART_PATTERN = re.compile(r"[A-Z]?[a-z]+|[A-Z]+(?![a-z])|[0-9]+")
+ARRAYS = ("offsets", "buckets", "counts", "idf", "postings_offsets", "postings_docs", "postings_weights")
+
+
+@lru_cache(maxsize=1 << 16)
+def word_buckets(word: str) -> Tuple[int, ...]:
+    """
+    Returns the hash buckets of an identifier: the lowercased identifier and, for compound ones, its parts.
+    """
+    terms = {word.lower(), *(part.lower() for part in PART_PATTERN.findall(word))}
+    return tuple(zlib.crc32(term.encode()) % DIMENSIONS for term in terms)
+
+
+def term_counts(text: str) -> Counter:
+    """
+    Returns how often each hash bucket occurs in `text`.
+    """
+    counts = Counter()
+    for word, n in Counter(WORD_PATTERN.findall(text)).items():
+        for bucket in word_buckets(word):
+            counts[bucket] += n
+    return counts
+
+
+class RelevanceIndex:
+    """
+    Hashed TF-IDF vectors of the files of a project, to rank them by their cosine similarity to a query.
+
+    Each file is a sparse vector of term counts (its rows in `offsets`, `buckets`, `counts`). From those,
+    an inverted index is derived: per bucket, the files containing it and their normalized TF-IDF weight,
+    so a query only touches the postings of its own terms. The arrays are stored as .npy files in
+    `directory` and memory-mapped when loaded; an update only reads the files whose size or mtime changed.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.names: List[str] = []
+        self.stats: List[List[int]] = []
+        self.arrays: Dict[str, np.ndarray] = {}
+        try:
+            meta = json.loads((self.directory / "files.json").read_text())
+            if meta["dimensions"] == DIMENSIONS:
+                self.arrays = {name: np.load(self.directory / f"{name}.npy", mmap_mode="r") for name in ARRAYS}
+                self.names, self.stats = meta["names"], meta["stats"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def update(self, files: List[Path], folder: Path, max_bytes: Optional[int] = None) -> int:
+        """
+        Makes the index cover exactly `files`, reading only new and changed ones, and saves it if anything changed.
+        Returns how many files were read.
+        """
+        rows = {name: i for i, name in enumerate(self.names)}
+        names, stats, buckets, counts = [], [], [], []
+        read = 0
+        for file in files:
+            name = relative_name(file, folder)
+            try:
+                stat = file.stat()
+                stat = [stat.st_size, stat.st_mtime_ns]
+            except OSError:
+                stat = None
+            i = rows.get(name)
+            if i is not None and self.stats[i] == stat:
+                start, end = self.arrays["offsets"][i], self.arrays["offsets"][i + 1]
+                buckets.append(self.arrays["buckets"][start:end])
+                counts.append(self.arrays["counts"][start:end])
+            else:
+                content, _ = read_bounded(file, name, max_bytes)
+                # the path counts as part of the file
+                terms = term_counts(f"{name}\n{content or ''}")
+                buckets.append(np.fromiter(terms.keys(), np.int32, len(terms)))
+                counts.append(np.fromiter(terms.values(), np.float32, len(terms)))
+                read += 1
+            names.append(name)
+            stats.append(stat)
+        if read == 0 and names == self.names:
+            return 0
+
+        self.names, self.stats = names, stats
+        sizes = np.array([len(row) for row in buckets], np.int64)
+        self.arrays = {
+            "offsets": np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64),
+            "buckets": np.concatenate(buckets or [np.zeros(0, np.int32)]).astype(np.int32),
+            "counts": np.concatenate(counts or [np.zeros(0, np.float32)]).astype(np.float32),
+        }
+        self.arrays.update(self._postings(sizes))
+        self.save()
+        return read
+
+    def _postings(self, sizes: np.ndarray) -> Dict[str, np.ndarray]:
+        buckets, counts = self.arrays["buckets"], self.arrays["counts"]
+        docs = np.repeat(np.arange(len(sizes), dtype=np.int32), sizes)
+        document_frequency = np.bincount(buckets, minlength=DIMENSIONS)
+        idf = (np.log((1 + len(sizes)) / (1 + document_frequency)) + 1).astype(np.float32)
+        weights = (1 + np.log(counts)) * idf[buckets]
+        norms = np.sqrt(np.bincount(docs, weights=weights * weights, minlength=len(sizes)))
+        weights = (weights / np.maximum(norms, 1e-12)[docs]).astype(np.float32)
+        order = np.argsort(buckets, kind="stable")
+        return {
+            "idf": idf,
+            "postings_offsets": np.concatenate([[0], np.cumsum(document_frequency)]).astype(np.int64),
+            "postings_docs": docs[order],
+            "postings_weights": weights[order],
+        }
+
+    def save(self) -> None:
+        # written next to the index and swapped in, so readers never see half an index
+        temporary = self.directory.with_name(f"{self.directory.name}.{os.getpid()}.tmp")
+        old = self.directory.with_name(f"{self.directory.name}.{os.getpid()}.old")
+        temporary.mkdir(parents=True, exist_ok=True)
+        for name in ARRAYS:
+            np.save(temporary / f"{name}.npy", self.arrays[name])
+        meta = {"dimensions": DIMENSIONS, "names": self.names, "stats": self.stats}
+        (temporary / "files.json").write_text(json.dumps(meta))
+        if self.directory.exists():
+            os.replace(self.directory, old)
+        os.replace(temporary, self.directory)
+        shutil.rmtree(old, ignore_errors=True)
+
+    def scores(self, query: str) -> np.ndarray:
+        """
+        Returns the cosine similarity of every file to `query`, in the order of `names`.
+        """
+        scores = np.zeros(len(self.names))
+        if not self.names:
+            return scores
+        offsets, idf = self.arrays["postings_offsets"], self.arrays["idf"]
+        terms = term_counts(query)
+        slices = [(offsets[bucket], offsets[bucket + 1]) for bucket in terms]
+        if not any(end > start for start, end in slices):
+            return scores
+        docs = np.concatenate([self.arrays["postings_docs"][start:end] for start, end in slices])
+        weights = np.concatenate([
+            self.arrays["postings_weights"][start:end] * ((1 + math.log(n)) * idf[bucket])
+            for (start, end), (bucket, n) in zip(slices, terms.items())
+        ])
+        return np.bincount(docs, weights=weights, minlength=len(self.names))
+
+    def top(self, query: str, k: int) -> List[str]:
+        """
+        Returns the names of the `k` files most similar to `query`, most similar first. Files sharing no term with it aren't returned.
+        """
+        scores = self.scores(query)
+        k = min(k, len(scores))
+        if k == 0:
+            return []
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return [self.names[i] for i in best if scores[i] > 0]
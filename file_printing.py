@@ -1,9 +1,153 @@
-from pathlib import Path
-from typing import List, Optional, Union
+from __future__ import annotations
 
-from tiktoken import Encoding
+import codecs
+import mmap
+import os
+import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, BinaryIO, Callable, Iterable, Iterator, List, Optional, TextIO, Tuple, Union
 
+from chunking import split_definitions
+from profiling import Profile, stage
 from settings import SUFFIX_TO_LANGUAGE
+from skeleton import SKELETON_SUFFIXES, skeleton
+from token_cache import TokenCache, content_hash
+from tokenization import CAP_CHARS_PER_TOKEN, batch_size, count_tokens, estimate_tokens
+
+if TYPE_CHECKING:
+    from tiktoken import Encoding
+
+
+SECTION_SEPARATOR = "\n\n"
+SNIFF_BYTES = 8192
+# with concurrent reads, how many batches may be read ahead of the one being counted
+PREFETCH_BATCHES = 2
+TEXT_ENCODING = "utf-8"
+
+
+@dataclass
+class FileRecord:
+    """
+    A file read and counted once per run: its content, rendered `## file` section and section token count.
+    `content` is None when the file is binary or could not be read, in which case `section` is empty.
+    `truncated` is set when `content` is a head and tail excerpt of a file over the size or token limit.
+    `skeleton` is set when `content` is the skeleton of a Python file, which is `saved` tokens shorter than the file.
+    `approximation` is "~" when `tokens` is estimated from the file size, and ">" when counting stopped at `tokens`.
+    """
+    path: Path
+    name: str
+    content: Optional[str]
+    section: str
+    tokens: int
+    truncated: bool = False
+    skeleton: bool = False
+    saved: Optional[int] = None
+    approximation: str = ""
+
+
+def relative_name(file: Path, folder: Optional[Path] = None) -> str:
+    try:
+        return str(file.relative_to(folder)) if folder else str(file)
+    except ValueError:
+        return str(file)
+
+
+def is_binary(head: bytes) -> bool:
+    """
+    Sniffs the first bytes of a file: it's binary if they contain a NUL byte or aren't valid text.
+    """
+    if b"\0" in head:
+        return True
+    try:
+        codecs.getincrementaldecoder(TEXT_ENCODING)().decode(head, final=False)
+    except UnicodeDecodeError:
+        return True
+    return False
+
+
+def decode(data: bytes, errors: str = "strict") -> str:
+    # newlines are translated like `Path.read_text` does
+    return data.decode(TEXT_ENCODING, errors).replace("\r\n", "\n").replace("\r", "\n")
+
+
+def excerpt(head: str, tail: str, omitted: str) -> str:
+    # only newlines are stripped, so the first line of the tail keeps its indentation
+    head, tail = head.rstrip("\n"), tail.lstrip("\n")
+    return f"{head}\n\n[... {omitted} omitted ...]\n\n{tail}"
+
+
+def read_excerpt(f: BinaryIO, max_bytes: int) -> str:
+    """
+    Returns the first and last `max_bytes / 2` bytes of an open file, cut at line boundaries.
+    The file is mapped instead of read, so only those pages are loaded.
+    """
+    half = max_bytes // 2
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        size = len(data)
+        head, tail = data[:half], data[size-half:]
+    head = head[:head.rfind(b"\n")+1] or head
+    tail = tail[tail.find(b"\n")+1:] or tail
+    return excerpt(decode(head, "ignore"), decode(tail, "ignore"), f"{size - len(head) - len(tail)} bytes")
+
+
+def read_bounded(
+    file: Path, file_name: Union[Path, str], max_bytes: Optional[int] = None, profile: Optional[Profile] = None,
+) -> Tuple[Optional[str], bool]:
+    """
+    Returns the content of a text file and whether it was cut to an excerpt because it's over `max_bytes`.
+    The content is None for binary files, which are recognized from their first SNIFF_BYTES bytes
+    without reading the rest, and for files that can't be read.
+    """
+    try:
+        with file.open("rb") as f:
+            head = f.read(SNIFF_BYTES)
+            if profile:
+                profile.count("files read")
+                profile.count("bytes read", len(head))
+            if is_binary(head):
+                return None, False
+            if max_bytes is not None and os.fstat(f.fileno()).st_size > max_bytes:
+                content = read_excerpt(f, max_bytes)
+                if profile:
+                    profile.count("bytes read", max_bytes - min(max_bytes, len(head)))
+                return content.strip(), True
+            rest = f.read()
+            if profile:
+                profile.count("bytes read", len(rest))
+            return decode(head + rest).strip(), False
+    except Exception as e:
+        print(f"Error reading {file_name}: {e}", file=sys.stderr)
+        return None, False
+
+
+def read_file(file: Path, file_name: Union[Path, str], max_bytes: Optional[int] = None) -> Optional[str]:
+    return read_bounded(file, file_name, max_bytes)[0]
+
+
+def token_excerpt(content: str, enc: Encoding, max_tokens: int, tokens: Optional[int] = None) -> str:
+    """
+    Returns the first and last `max_tokens / 2` tokens of `content`, cut at line boundaries. Only about
+    `CAP_CHARS_PER_TOKEN` characters per token are encoded at each end; `tokens` is the token count of
+    `content` for the omitted count, which is counted if not given.
+    """
+    half = max_tokens // 2
+    window = half * CAP_CHARS_PER_TOKEN
+    head = enc.decode(enc.encode_ordinary(content[:window])[:half])
+    tail_tokens = enc.encode_ordinary(content[max(0, len(content) - window):])
+    tail = enc.decode(tail_tokens[max(0, len(tail_tokens) - half):])
+    head = head[:head.rfind("\n")+1] or head
+    tail = tail[tail.find("\n")+1:] or tail
+    if tokens is None:
+        tokens = len(enc.encode_ordinary(content))
+    omitted = tokens - len(enc.encode_ordinary(head)) - len(enc.encode_ordinary(tail))
+    return excerpt(head, tail, f"{omitted} tokens")
+
+
+def render_section(file: Path, file_name: Union[Path, str], file_content: str) -> str:
+    return f"## {file_name}\n```{SUFFIX_TO_LANGUAGE.get(file.suffix, file.suffix)}\n{file_content}\n```"
 
 
 def read_files(files: Union[Path, List[Path]], folder: Optional[Path] = None) -> str:
@@ -14,64 +158,454 @@ def read_files(files: Union[Path, List[Path]], folder: Optional[Path] = None) ->
     files_texts = []
     for file in files:
         file_name = file.relative_to(folder) if folder else file
-        file_content = "ERROR READING THIS FILE"
+        file_content = read_file(file, file_name)
+        if file_content is None:
+            continue
+        files_texts.append(render_section(file, file_name, file_content))
+    return SECTION_SEPARATOR.join(files_texts)
+
+
+def cache_name(record: FileRecord, max_bytes: Optional[int], cap: Optional[int] = None) -> str:
+    # an excerpt depends on the size limit, not only on the file, and a capped count on the cap
+    name = f"{record.name} [{cap} token cap]" if cap is not None else record.name
+    if record.skeleton:
+        return f"{name} [skeleton]"
+    return f"{name} [{max_bytes} bytes]" if record.truncated else name
+
+
+def token_label(record: FileRecord) -> Union[int, str]:
+    # the token count as listed in the info table
+    return f"{record.approximation}{record.tokens}" if record.approximation else record.tokens
+
+
+def estimate_records(files: List[Path], folder: Optional[Path], enc: Encoding) -> Iterator[FileRecord]:
+    """
+    Records with token counts estimated from the file sizes, without reading the files. Like exact counts,
+    they count the whole section: the estimate of the content plus the exact tokens of the section's header.
+    """
+    for file in files:
         try:
-            file_content = file.read_text().strip()
-        except Exception as e:
-            print(f"Error reading {file_name}: {e}")
+            size = file.stat().st_size
+        except OSError:
+            size = 0
+        name = relative_name(file, folder)
+        tokens = estimate_tokens(size, file.suffix) + len(enc.encode_ordinary(render_section(file, name, "")))
+        yield FileRecord(file, name, None, "", tokens, approximation="~")
+
+
+def cached_skeleton(content: str, cache: Optional[TokenCache] = None) -> Optional[str]:
+    """
+    Returns the skeleton of Python `content`, from `cache` when it was extracted before.
+    """
+    if cache is None:
+        return skeleton(content)
+    hash = content_hash(content)
+    found, outline = cache.skeleton(hash)
+    if not found:
+        outline = skeleton(content)
+        cache.put_skeleton(hash, outline)
+    return outline
+
+
+def iter_records(
+    files: List[Path], folder: Optional[Path], enc: Encoding, cache: Optional[TokenCache] = None,
+    workers: int = 1, max_bytes: Optional[int] = None, max_tokens: Optional[int] = None,
+    profile: Optional[Profile] = None, readers: int = 1, skeletons: bool = False, cap: Optional[int] = None,
+) -> Iterator[FileRecord]:
+    """
+    Reads and counts every file exactly once, reusing `cache` for unchanged files.
+    Files are processed in batches whose cache misses are counted together on `workers` threads,
+    so only one batch of file contents is held in memory unless the caller keeps the records.
+
+    Files over `max_bytes` are read as a head and tail excerpt, sections over `max_tokens` are cut
+    to one as well.
+
+    With `readers > 1`, files are read on that many threads, up to PREFETCH_BATCHES batches ahead of
+    the one being counted, so reads overlap with tokenizing and with the caller. Records are still
+    yielded in the order of `files`.
+
+    With `skeletons`, Python files are rendered as their skeleton (see skeleton.py), and the full file is
+    counted as well to report the tokens saved. Files whose skeleton isn't shorter are kept in full.
+
+    With a `cap`, counting a file stops once it has more tokens than that (see `capped_count`), and its
+    record gets `cap` tokens and approximation ">".
+    """
+    def read(file: Path) -> Tuple[str, Optional[str], bool]:
+        name = relative_name(file, folder)
+        with stage(profile, "read", name):
+            return (name, *read_bounded(file, name, max_bytes, profile))
+
+    size = batch_size(workers)
+    batches = [files[start:start+size] for start in range(0, len(files), size)]
+    pool = ThreadPoolExecutor(readers, thread_name_prefix="read") if readers > 1 else None
+    ahead = deque()
+    try:
+        for i, batch in enumerate(batches):
+            if pool:
+                for next_batch in batches[i+len(ahead):i+1+PREFETCH_BATCHES]:
+                    ahead.append([pool.submit(read, file) for file in next_batch])
+                contents = [future.result() for future in ahead.popleft()]
+            else:
+                contents = map(read, batch)
+            yield from _count_batch(batch, contents, enc, cache, workers, max_bytes, max_tokens, profile, skeletons, cap)
+    finally:
+        if pool:
+            pool.shutdown(cancel_futures=True)
+
+
+def _count_batch(
+    batch: List[Path], contents: Iterable[Tuple[str, Optional[str], bool]], enc: Encoding,
+    cache: Optional[TokenCache], workers: int, max_bytes: Optional[int], max_tokens: Optional[int],
+    profile: Optional[Profile], skeletons: bool = False, cap: Optional[int] = None,
+) -> List[FileRecord]:
+    records, misses = [], []
+    # full contents and sections of the files rendered as skeletons, and the ones whose count isn't cached
+    full_contents, full_sections, full_tokens, full_misses = {}, {}, {}, []
+    for file, (name, content, truncated) in zip(batch, contents):
+        outline = None
+        if skeletons and content is not None and not truncated and file.suffix in SKELETON_SUFFIXES:
+            with stage(profile, "skeleton", name):
+                outline = cached_skeleton(content, cache)
+        with stage(profile, "render"):
+            section = render_section(file, name, outline if outline is not None else content) if content is not None else ""
+            if outline is not None:
+                full_contents[name], full_sections[name] = content, render_section(file, name, content)
+        record = FileRecord(file, name, content if outline is None else outline, section, None, truncated, outline is not None)
+        with stage(profile, "cache"):
+            record.tokens = cache.get(file, cache_name(record, max_bytes, cap), enc.name, section) if cache else None
+            if record.skeleton:
+                full_tokens[name] = cache.get(file, name, enc.name, full_sections[name]) if cache else None
+        records.append(record)
+        if record.tokens is None:
+            misses.append(record)
+        if record.skeleton and full_tokens[name] is None:
+            full_misses.append(record)
+
+    timings = [] if profile else None
+    with stage(profile, "tokenize"):
+        counts = count_tokens([record.section for record in misses], enc, workers, timings, cap)
+        counts += count_tokens([full_sections[record.name] for record in full_misses], enc, workers, timings)
+    if profile:
+        profile.count("tokens encoded", sum(counts))
+        for record, seconds in zip(misses + full_misses, timings):
+            profile.file("tokenize", record.name, seconds)
+    for record, tokens in zip(misses, counts):
+        record.tokens = tokens
+        if cache:
+            with stage(profile, "cache"):
+                cache.put(record.path, cache_name(record, max_bytes, cap), enc.name, record.section, tokens)
+    for record, tokens in zip(full_misses, counts[len(misses):]):
+        full_tokens[record.name] = tokens
+        if cache:
+            with stage(profile, "cache"):
+                cache.put(record.path, record.name, enc.name, full_sections[record.name], tokens)
+    for record in records:
+        if not record.skeleton:
             continue
-        files_texts.append(f"## {file_name}\n```{SUFFIX_TO_LANGUAGE.get(file.suffix, file.suffix)}\n{file_content}\n```")
-    return "\n\n".join(files_texts)
-
-
-def directory_outline_full(files: List[Path], folder: Path, enc: Encoding) -> str:
-    individual_file_token_counts = [len(enc.encode(read_files(file))) for file in files]
-    max_token_count_digits = len(str(max(individual_file_token_counts)))
-
-    info = ""
-    for i, (token_count, file) in enumerate(zip(individual_file_token_counts, files)):
-        token_count_str = str(token_count).ljust(max_token_count_digits)
-        clean_name = file.relative_to(folder)
-        info += f"{clean_name} ({token_count_str.strip()})\n"
-    return info
-
-
-def directory_outline_pretty(files: List[Path], folder: Path, enc) -> str:
-    def print_files(path: Path, file_list: List[Path], prefix: str = ""):
-        lines = []
-        contents = sorted(path.iterdir())
-        for i, item in enumerate(contents):
-            is_last = i == len(contents) - 1
-            if item in file_list:
-                with open(item, "r") as f:
-                    count = len(enc.encode(f.read()))
-                lines.append(
-                    f"{prefix}{'└── ' if is_last else '├── '}{item.name} ({count})"
-                )
-            if item.is_dir():
-                new_prefix = prefix + ("    " if is_last else "│   ")
-                lines.extend(print_files(item, file_list, new_prefix))
-        return lines
+        if record.tokens < full_tokens[record.name]:
+            record.saved = full_tokens[record.name] - record.tokens
+        else:
+            # the skeleton of a file made of signatures can be larger than the file
+            record.content, record.section = full_contents[record.name], full_sections[record.name]
+            record.tokens, record.skeleton, record.saved = full_tokens[record.name], False, 0
+
+    if cap is not None:
+        for record in records:
+            if record.tokens > cap:
+                record.tokens, record.approximation = cap, ">"
+    if max_tokens is not None:
+        for record in records:
+            if record.tokens > max_tokens and record.content is not None and not record.approximation:
+                # the section's count less its header is the count of the content
+                header = len(enc.encode_ordinary(render_section(record.path, record.name, "")))
+                record.content = token_excerpt(record.content, enc, max_tokens, record.tokens - header)
+                record.section = render_section(record.path, record.name, record.content)
+                name = f"{cache_name(record, max_bytes)} [{max_tokens} token excerpt]"
+                record.tokens = cache.get(record.path, name, enc.name, record.section) if cache else None
+                if record.tokens is None:
+                    record.tokens = len(enc.encode_ordinary(record.section))
+                    if cache:
+                        cache.put(record.path, name, enc.name, record.section, record.tokens)
+                record.truncated = True
+    if cache:
+        # per batch, so other runs sharing the cache don't wait for the whole pass
+        cache.commit()
+    return records
+
+
+def build_records(
+    files: List[Path], folder: Optional[Path], enc: Encoding, cache: Optional[TokenCache] = None,
+    workers: int = 1, max_bytes: Optional[int] = None, max_tokens: Optional[int] = None, readers: int = 1,
+    skeletons: bool = False,
+) -> List[FileRecord]:
+    return list(iter_records(files, folder, enc, cache, workers, max_bytes, max_tokens, readers=readers, skeletons=skeletons))
+
+
+def separator_tokens(previous: str, next: str, enc: Encoding, separator: str = SECTION_SEPARATOR) -> int:
+    """
+    Returns how many tokens joining `previous` and `next` with `separator` adds to their separate counts.
+    Sections start with "## " and end on a fence line, so only the last line of `previous` and the
+    first line of `next` can merge with the separator and the result is exact.
+    """
+    tail = previous[previous.rfind("\n")+1:]
+    head = next[:next.find("\n")+1] if "\n" in next else next
+    return len(enc.encode_ordinary(tail + separator + head)) - len(enc.encode_ordinary(tail)) - len(enc.encode_ordinary(head))
+
+
+class SectionTotal:
+    """
+    Running token count of sections joined with SECTION_SEPARATOR, see `separator_tokens`.
+    """
+
+    def __init__(self, enc: Encoding):
+        self.enc = enc
+        self.tokens = 0
+        self._tail = None
+        self._separators = {}
+
+    def joined(self, record: FileRecord) -> int:
+        """
+        Returns what `tokens` would be after adding `record`.
+        """
+        if record.content is None:
+            return self.tokens
+        if self._tail is None:
+            return self.tokens + record.tokens
+        key = (self._tail, record.section[:record.section.find("\n")+1])
+        if key not in self._separators:
+            self._separators[key] = separator_tokens(self._tail, record.section, self.enc)
+        return self.tokens + self._separators[key] + record.tokens
+
+    def add(self, record: FileRecord) -> None:
+        if record.content is None:
+            return
+        self.tokens = self.joined(record)
+        self._tail = record.section[record.section.rfind("\n")+1:]
+
+
+class SummaryWriter:
+    """
+    Writes the summary to `out` as it goes: sections as soon as they're read and counted, the folder
+    layout and task once all files are done. `tokens` is the total of the sections written so far.
+    """
+
+    def __init__(self, out: TextIO, folder: Path, enc: Encoding):
+        self.out = out
+        self.total = SectionTotal(enc)
+        self.out.write(f"# Open Files (relative to {folder})\n\n")
+
+    @property
+    def tokens(self) -> int:
+        return self.total.tokens
+
+    def write(self, record: FileRecord) -> None:
+        if record.content is None:
+            return
+        if self.total._tail is not None:
+            self.out.write(SECTION_SEPARATOR)
+        self.out.write(record.section)
+        self.total.add(record)
+
+    def finish(self, folder_layout: str, task_instruction: str) -> None:
+        self.out.write("\n")
+        self.out.write("\n\n# Folder Layout\n")
+        self.out.write(folder_layout)
+        self.out.write(f"\n\n# Task\n\n{task_instruction}\n\n\n\n")
+
+
+class ShardWriter:
+    """
+    Writes the summary as shards of at most `shard_tokens` tokens and passes each one, when it's full, to
+    `emit(number, text, tokens)`. Every shard starts with the folder `layout` and ends with the task.
+    Records are packed in the order they come, by their counted tokens, so this takes one pass; a file that
+    doesn't fit in a shard of its own is split at definition boundaries (see `split_definitions`) into
+    "## file (part k/n)" sections. `tokens` is the total of the shards emitted so far, and `overhead` the
+    size of a shard without files.
+    """
+
+    def __init__(
+        self, emit: Callable[[int, str, int], Any], folder: Path, enc: Encoding, layout: str, task_instruction: str,
+        shard_tokens: int,
+    ):
+        self.emit = emit
+        self.folder = folder
+        self.enc = enc
+        self.layout = layout
+        self.shard_tokens = shard_tokens
+        self.footer = self._text_record(f"# Task\n\n{task_instruction}\n")
+        self.shards = 0
+        self.tokens = 0
+        self._footer_separators = {}
+        self._open()
+        self.overhead = self._with_footer(self._total.tokens, self._sections[-1])
+
+    def _text_record(self, text: str) -> FileRecord:
+        return FileRecord(Path(), "", text, text, len(self.enc.encode_ordinary(text)))
+
+    def _open(self) -> None:
+        self.shards += 1
+        header = self._text_record(
+            f"# Folder Layout\n{self.layout}\n\n# Open Files (relative to {self.folder}, shard {self.shards})"
+        )
+        self._sections = [header.section]
+        self._total = SectionTotal(self.enc)
+        self._total.add(header)
+
+    def _with_footer(self, tokens: int, last_section: str) -> int:
+        # the shard's tokens when the footer follows `last_section`, see `separator_tokens`
+        tail = last_section[last_section.rfind("\n")+1:]
+        if tail not in self._footer_separators:
+            self._footer_separators[tail] = separator_tokens(tail, self.footer.section, self.enc)
+        return tokens + self._footer_separators[tail] + self.footer.tokens
+
+    def _fits(self, record: FileRecord) -> bool:
+        return self._with_footer(self._total.joined(record), record.section) <= self.shard_tokens
+
+    def _add(self, record: FileRecord) -> None:
+        self._sections.append(record.section)
+        self._total.add(record)
+
+    def _close(self) -> None:
+        tokens = self._with_footer(self._total.tokens, self._sections[-1])
+        self.emit(self.shards, SECTION_SEPARATOR.join(self._sections + [self.footer.section]), tokens)
+        self.tokens += tokens
+
+    def _parts(self, record: FileRecord) -> List[FileRecord]:
+        # the tokens of a shard with one empty part are overhead, the rest is left for the part's content;
+        # token counts of the chunks don't add up exactly, so the budget shrinks by any overflow and it's split again
+        def section(k: int, n: int, chunk: str) -> FileRecord:
+            return self._text_record(render_section(record.path, f"{record.name} (part {k}/{n})", chunk))
+
+        def overflow(part: FileRecord) -> int:
+            return self._with_footer(self._total.joined(part), part.section) - self.shard_tokens
+
+        budget = -overflow(section(999, 999, ""))
+        parts = []
+        for _ in range(3):
+            chunks = split_definitions(
+                record.content, record.path.suffix, max(1, budget), lambda text: len(self.enc.encode_ordinary(text)),
+            )
+            parts = [section(k, len(chunks), chunk) for k, chunk in enumerate(chunks, 1)]
+            excess = max(overflow(part) for part in parts)
+            if excess <= 0:
+                break
+            budget -= excess
+        else:
+            # lines longer than a shard can't be split
+            print(
+                f"{record.name} has parts over --shard_tokens {self.shard_tokens} by up to {excess} tokens",
+                file=sys.stderr,
+            )
+        return parts
+
+    def write(self, record: FileRecord) -> None:
+        if record.content is None:
+            return
+        if not self._fits(record) and len(self._sections) > 1:
+            self._close()
+            self._open()
+        if self._fits(record):
+            self._add(record)
+            return
+        for part in self._parts(record):
+            if not self._fits(part) and len(self._sections) > 1:
+                self._close()
+                self._open()
+            self._add(part)
+
+    def finish(self) -> None:
+        # a summary without sections still gets a shard
+        if len(self._sections) > 1 or self.shards == 1:
+            self._close()
+
+
+def shard_overhead(folder: Path, enc: Encoding, layout: str, task_instruction: str) -> int:
+    """
+    Returns the tokens of a --shard_tokens shard without files: the folder layout, the task and their headers.
+    """
+    return ShardWriter(lambda *shard: None, folder, enc, layout, task_instruction, 0).overhead
+
+
+def outline_counts(
+    files: List[Path], folder: Path, enc: Encoding, cache: Optional[TokenCache] = None,
+    records: Optional[List[FileRecord]] = None, token_counts: Optional[List[int]] = None,
+) -> List[int]:
+    """
+    Returns the token count of each file: `token_counts` if given, else those of `records`, else the
+    files are read and counted.
+    """
+    if token_counts is not None:
+        return token_counts
+    records = records if records is not None else build_records(files, folder, enc, cache)
+    counts = {record.path: record.tokens for record in records}
+    return [counts[file] for file in files]
+
+
+def outline_names(files: List[Path], folder: Path) -> Iterator[str]:
+    # the names `relative_name` gives, by slicing strings instead of comparing path parts
+    root = str(folder) + os.sep
+    for file in files:
+        path = str(file)
+        yield path[len(root):] if path.startswith(root) else relative_name(file, folder)
+
+
+def outline_tree(files: List[Path], folder: Path, token_counts: List[int]) -> dict:
+    """
+    Returns the files as nested {directory name: {...}, file name: token count} dicts, in one pass.
+    Children keep the order of `files`, which is the tree order when `files` is sorted like `select_files` returns it.
+    """
+    tree = {}
+    for name, count in zip(outline_names(files, folder), token_counts):
+        parts = name.split(os.sep)
+        node = tree
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+        node[parts[-1]] = count
+    return tree
+
+
+def directory_outline_full(
+    files: List[Path], folder: Path, enc: Encoding, cache: Optional[TokenCache] = None,
+    records: Optional[List[FileRecord]] = None, token_counts: Optional[List[int]] = None,
+) -> str:
+    token_counts = outline_counts(files, folder, enc, cache, records, token_counts)
+    return "".join(f"{name} ({count})\n" for name, count in zip(outline_names(files, folder), token_counts))
+
+
+def directory_outline_pretty(
+    files: List[Path], folder: Path, enc: Encoding, cache: Optional[TokenCache] = None,
+    records: Optional[List[FileRecord]] = None, token_counts: Optional[List[int]] = None,
+) -> str:
+    tree = outline_tree(files, folder, outline_counts(files, folder, enc, cache, records, token_counts))
+
+    def print_files(node: dict, prefix: str = ""):
+        for i, (name, child) in enumerate(node.items()):
+            is_last = i == len(node) - 1
+            if isinstance(child, dict):
+                lines.append(f"{prefix}{'└── ' if is_last else '├── '}{name}/")
+                print_files(child, prefix + ("    " if is_last else "│   "))
+            else:
+                lines.append(f"{prefix}{'└── ' if is_last else '├── '}{name} ({child})")
 
     lines = ["."]
-    lines.extend(print_files(folder, files))
+    print_files(tree)
     return "\n".join(lines)
 
 
-def directory_outline_compact(files: List[Path], folder: Path, enc: Encoding) -> str:
-    def print_files(path: Path, file_list: List[Path], prefix: str = ""):
-        lines = []
-        contents = sorted(path.iterdir())
-        for i, item in enumerate(contents):
-            if item in file_list:
-                with open(item, "r") as f:
-                    count = len(enc.encode(f.read()))
-                lines.append(f"{prefix}- {item.name} ({count})")
-            if item.is_dir():
-                new_prefix = prefix + "  "
-                lines.extend(print_files(item, file_list, new_prefix))
-        return lines
+def directory_outline_compact(
+    files: List[Path], folder: Path, enc: Encoding, cache: Optional[TokenCache] = None,
+    records: Optional[List[FileRecord]] = None, token_counts: Optional[List[int]] = None,
+) -> str:
+    tree = outline_tree(files, folder, outline_counts(files, folder, enc, cache, records, token_counts))
+
+    def print_files(node: dict, prefix: str = ""):
+        for name, child in node.items():
+            if isinstance(child, dict):
+                lines.append(f"{prefix}- {name}/")
+                print_files(child, prefix + "  ")
+            else:
+                lines.append(f"{prefix}- {name} ({child})")
 
     lines = []
-    lines.extend(print_files(folder, files))
+    print_files(tree)
     return "\n".join(lines)
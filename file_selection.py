@@ -1,95 +1,195 @@
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import cached_property, lru_cache
 from pathlib import Path
-from typing import List, Callable, Any, Dict, Union
+from typing import List, Callable, Any, Collection, Dict, Optional, Tuple, Union
 
-from settings import FILTER_DOTFILES, FILTER_TESTS, FILETYPES_TO_INCLUDE
+from ignore_rules import IgnoreRules
+from settings import DOTFILE_PATTERN, FILTER_DOTFILES, FILETYPES_TO_INCLUDE, IGNORE_FILES, IGNORE_PATTERNS
+
+
+def default_rules(
+    root: Path,
+    filetypes_to_include: Collection[str] = FILETYPES_TO_INCLUDE,
+    filter_dotfiles: bool = FILTER_DOTFILES,
+    patterns: Collection[str] = (),
+    ignore_files: Collection[str] = IGNORE_FILES,
+) -> IgnoreRules:
+    """
+    Returns the rules `select_files` applies by default: the settings' IGNORE_PATTERNS, then the
+    ignore files found while walking, then `patterns`.
+    """
+    rules = IgnoreRules(
+        root,
+        suffixes=filetypes_to_include,
+        ignore_files=ignore_files,
+        rules=[("", pattern) for pattern in ([DOTFILE_PATTERN] if filter_dotfiles else []) + IGNORE_PATTERNS],
+    )
+    return rules.extend("", list(patterns))
+
+
+@lru_cache(maxsize=None)
+def _name_rules(filetypes_to_include: frozenset, filter_dotfiles: bool) -> IgnoreRules:
+    return default_rules(Path(), filetypes_to_include, filter_dotfiles, ignore_files=())
 
 
 def global_filter(
     file: Path,
     filetypes_to_include: List[str] = FILETYPES_TO_INCLUDE,
     filter_dotfiles: bool = FILTER_DOTFILES,
-    filter_tests: bool = FILTER_TESTS,
+    is_dir: Optional[bool] = None,
     **kwargs
 ) -> bool:
     """
     Returns wether a file is passes the filter.
+    `is_dir` can be passed by callers that already know the file type, to avoid stat calls.
+
+    The default IGNORE_PATTERNS only look at file names, so this matches them against `file.name`.
     """
+    rules = _name_rules(frozenset(filetypes_to_include), filter_dotfiles)
+    return not rules.ignored(file.name, file.is_dir() if is_dir is None else is_dir)
 
-    FILTERS: List[bool] = [
-        not (filter_dotfiles and file.name.startswith(".")),
-        not (filter_tests
-            and (file.name.startswith("test") and file.name.startswith("__tests__"))
-        ),
-        # Django
-        not file.name.startswith("migrations"),
-        not file.name.startswith("admin"),
-        #not file.name.startswith("apps"),
-    ]
-    if not all(FILTERS):
-        return False
-    
-    if file.is_file():
-        FILE_FILTERS: List[bool] = [
-            file.suffix in filetypes_to_include,
-            # Python
-            not file.name.startswith("__init__"),
-        ]
-        if not all(FILE_FILTERS):
-            return False
-
-    if file.is_dir():
-        DIR_FILTERS: List[bool] = [
-            # Python
-            "venv" not in str(file.name),
-            # Django
-            "htmlcov" not in str(file.name),
-            "dist" not in str(file.name),
-            # Node
-            "node_modules" not in str(file.name),
-            # ElderJs
-            "___ELDER___" not in str(file.name),
-        ]
-        if not all(DIR_FILTERS):
-            return False
-            
-
-    return True
 
+def filter_files(working_dir: Path, files_and_folders: List[Path]) -> Callable[[Path, Dict[str, Any]], bool]:
+    """
+    Returns a filter that rejects `files_and_folders` (relative to `working_dir`) and everything below them.
 
+    The excluded paths are resolved into a set, and each directory is resolved and looked up once:
+    its result is remembered, so a file costs one dict lookup, whatever the number of excluded paths.
+    """
+    abs_files_and_folders = {p.resolve() if p.is_absolute() else (working_dir / p).resolve() for p in files_and_folders}
+    directories: Dict[Path, Tuple[Path, bool]] = {}  # directory -> (resolved directory, excluded)
+
+    def _directory(directory: Path) -> Tuple[Path, bool]:
+        unknown = []
+        while directory not in directories and directory.parent != directory:
+            unknown.append(directory)
+            directory = directory.parent
+        if directory not in directories:
+            resolved = directory.resolve()
+            directories[directory] = (resolved, resolved in abs_files_and_folders)
+        excluded = directories[directory][1]
+        for directory in reversed(unknown):
+            resolved = directory.resolve()
+            excluded = excluded or resolved in abs_files_and_folders
+            directories[directory] = (resolved, excluded)
+        return directories[directory]
 
-def filter_files(working_dir: Path, files_and_folders: List[Path]) -> Callable[[Path, Dict[str, Any]], bool]:
-    abs_files_and_folders = [p.resolve() if p.is_absolute() else (working_dir / p).resolve() for p in files_and_folders]
     def _exclude_files(file: Path, **kwargs) -> bool:
-        return not any([bool(parent in abs_files_and_folders) for parent in file.parents])
+        resolved_parent, excluded = _directory(file.parent)
+        return not (excluded or resolved_parent / file.name in abs_files_and_folders)
     return _exclude_files
 
 
-def python_files_only(file: Path, **kwargs) -> bool:
-    return file.is_dir() or file.suffix == ".py"
+def python_files_only(file: Path, is_dir: Optional[bool] = None, **kwargs) -> bool:
+    return (file.is_dir() if is_dir is None else is_dir) or file.suffix == ".py"
+
+
+class PrunedDirectory(type(Path())):
+    """
+    Placeholder for a directory that `select_files` didn't descend into.
+    `file_count` walks the directory the first time it is accessed.
+    """
+
+    @cached_property
+    def file_count(self) -> int:
+        count, stack = 0, [str(self)]
+        while stack:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file():
+                        count += 1
+        return count
+
+    def placeholder(self, folder: Path, count: bool = False) -> str:
+        return f"{self.relative_to(folder)}/ ..." + (f" ({self.file_count} file{'' if self.file_count == 1 else 's'})" if count else "")
+
+
+def _list_directory(
+    path: Path, select: bool, rules: Optional[IgnoreRules], relative: str,
+) -> List[Tuple[Path, bool, bool, Optional[IgnoreRules], str]]:
+    """
+    Lists a directory for `select_files`: returns its files and subdirectories as walk items, with the
+    rules extended by the ignore files it contains. Only reads the filesystem, so it can run on any thread.
+    """
+    with os.scandir(path) as entries:
+        entries = list(entries)
+    if rules:
+        rules = rules.for_directory(path, relative, [entry.name for entry in entries])
+    children = []
+    for entry in entries:
+        child = f"{relative}/{entry.name}" if relative else entry.name
+        if entry.is_dir():
+            children.append((Path(entry.path), True, select, rules, child))
+        elif entry.is_file():
+            children.append((Path(entry.path), False, select, rules, child))
+    return children
 
 
 def select_files(
     files_and_folders: Union[Path, List[Path]],
     filters: List[Callable[[Path, Dict[str, Any]], bool]] = [global_filter],
+    prune: bool = False,
+    rules: Optional[IgnoreRules] = None,
+    threads: int = 1,
     **filter_kwargs: Dict[str, Any]
 ) -> List[List[Path]]:
+    """
+    Walks `files_and_folders` and returns (selected_files, all_files), both sorted.
+    Files below a directory that doesn't pass `filters` or `rules` end up in `all_files` only, or with
+    `prune` the directory isn't walked and a single `PrunedDirectory` takes their place in `all_files`.
+
+    The walk is iterative and uses the file type cached on `os.scandir` entries, which is passed to
+    the filters as `is_dir`, so files cost no stat calls on most filesystems.
+    Ignore files (.gitignore, ...) found along the way extend `rules` for their directory.
 
+    With `threads > 1`, up to that many directories are listed at once, which hides the round trips
+    of network filesystems. The filters still run on the calling thread, and the result is the same.
+    """
     selected_files, all_files = [], []
-    
-    def _select_files(path: Path, select: bool = True):
-        select = select and all([filter(path, **filter_kwargs) for filter in filters])
-        
-        # recursively collect files
-        if path.is_file():
+
+    def visit(path: Path, is_dir: bool, select: bool, path_rules: Optional[IgnoreRules], relative: str):
+        # returns the arguments of `_list_directory` if `path` is a directory to walk
+        select = (
+            select
+            and not (path_rules and relative and path_rules.ignored(relative, is_dir))
+            and all(filter(path, is_dir=is_dir, **filter_kwargs) for filter in filters)
+        )
+        if not is_dir:
             if select:
                 selected_files.append(path)
             all_files.append(path)
-        elif path.is_dir():
-            for child in path.iterdir():
-                _select_files(child, select)
-    
-    for item in files_and_folders if isinstance(files_and_folders, list) else [files_and_folders]:
-        _select_files(item)
+        elif prune and not select:
+            all_files.append(PrunedDirectory(path))
+        else:
+            return path, select, path_rules, relative
+
+    roots = files_and_folders if isinstance(files_and_folders, list) else [files_and_folders]
+    stack = []
+    for root in reversed(roots):
+        if root.is_dir() or root.is_file():
+            relative = rules.relative(root) if rules else ""
+            stack.append((root, root.is_dir(), True, rules, "" if relative == "." else relative))
+
+    if threads <= 1:
+        while stack:
+            directory = visit(*stack.pop())
+            if directory:
+                stack.extend(_list_directory(*directory))
+    else:
+        with ThreadPoolExecutor(threads, thread_name_prefix="walk") as pool:
+            pending = set()
+            while stack or pending:
+                while stack:
+                    directory = visit(*stack.pop())
+                    if directory:
+                        pending.add(pool.submit(_list_directory, *directory))
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stack.extend(future.result())
+
     selected_files.sort()
     all_files.sort()
     return selected_files, all_files
@@ -0,0 +1,172 @@
+import re
+from pathlib import Path
+from typing import Collection, List, Optional, Tuple
+
+from settings import IGNORE_FILES
+
+
+def translate(pattern: str, basename: bool = False) -> Tuple[str, bool, bool]:
+    """
+    Translates a gitignore pattern into (regex, negate, dir_only).
+    The regex matches paths relative to the directory of the ignore file, with "/" separators,
+    or only the file name if `basename` (for patterns without a "/", see `is_basename_pattern`).
+    """
+    negate = pattern.startswith("!")
+    if negate or pattern.startswith("\\!") or pattern.startswith("\\#"):
+        pattern = pattern[1:]
+    dir_only = pattern.endswith("/")
+    pattern = pattern.rstrip("/")
+    anchored = "/" in pattern
+    pattern = pattern.lstrip("/")
+
+    regex, i = "", 0
+    while i < len(pattern):
+        c = pattern[i]
+        if pattern.startswith("**", i) and (i == 0 or pattern[i-1] == "/"):
+            if pattern.startswith("**/", i):
+                regex += "(?:.*/)?"
+                i += 3
+                continue
+            if i + 2 == len(pattern):
+                regex += ".*"
+                i += 2
+                continue
+        if c == "*":
+            regex += "[^/]*"
+        elif c == "?":
+            regex += "[^/]"
+        elif c == "[" and "]" in pattern[i+2:]:
+            end = pattern.index("]", i + 2)
+            chars = pattern[i+1:end]
+            if chars.startswith("!"):
+                chars = "^" + chars[1:]
+            regex += "[" + chars.replace("\\", "\\\\") + "]"
+            i = end
+        elif c == "\\" and i + 1 < len(pattern):
+            i += 1
+            regex += re.escape(pattern[i])
+        else:
+            regex += re.escape(c)
+        i += 1
+
+    return ("" if anchored or basename else "(?:.*/)?") + regex, negate, dir_only
+
+
+def is_basename_pattern(pattern: str) -> bool:
+    return "/" not in pattern.lstrip("!").rstrip("/")
+
+
+def read_patterns(file: Path) -> List[str]:
+    patterns = []
+    for line in file.read_text(errors="replace").splitlines():
+        if line.endswith("\\ "):
+            line = line.rstrip() + " "
+        else:
+            line = line.rstrip()
+        if line and not line.startswith("#"):
+            patterns.append(line)
+    return patterns
+
+
+class IgnoreRules:
+    """
+    gitignore-style rules compiled into regexes, separately for files and directories.
+
+    Rules are (base, pattern) pairs: `base` is the directory, relative to `root`, of the ignore file
+    the pattern came from. Later rules take precedence, so the alternatives are compiled in reverse
+    order and the first alternative that matches decides, negated patterns included.
+    Top-level patterns without a "/" go into a second regex that only sees the file name, which
+    avoids backtracking over the directories; a match there wins if it comes from a later rule.
+    Files whose suffix isn't in `suffixes` are ignored as well, when `suffixes` is given.
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        patterns: Collection[str] = (),
+        suffixes: Optional[Collection[str]] = None,
+        ignore_files: Collection[str] = IGNORE_FILES,
+        rules: Collection[Tuple[str, str]] = (),
+    ):
+        self.root = root
+        self.suffixes = frozenset(suffixes) if suffixes is not None else None
+        self.ignore_files = tuple(ignore_files)
+        self.rules = list(rules) + [("", pattern) for pattern in patterns]
+        self.matchers = {
+            is_dir: (self._compile(is_dir, basename=True), self._compile(is_dir, basename=False))
+            for is_dir in (False, True)
+        }
+
+    def _compile(self, is_dir: bool, basename: bool):
+        """
+        Returns (regex, rules) where rules[group] is the (index, negate) of the rule behind each group.
+        """
+        alternatives, rules = [], [None]
+        for index in reversed(range(len(self.rules))):
+            base, pattern = self.rules[index]
+            if basename != (not base and is_basename_pattern(pattern)):
+                continue
+            regex, negate, dir_only = translate(pattern, basename)
+            if dir_only and not is_dir:
+                continue
+            alternatives.append(f"({re.escape(base + '/') if base else ''}{regex})")
+            rules.append((index, negate))
+        if not alternatives:
+            return None, rules
+        return re.compile("|".join(alternatives), re.DOTALL), rules
+
+    def __str__(self) -> str:
+        rules = [f"{base}/{pattern}" if base else pattern for base, pattern in self.rules]
+        if self.suffixes is not None:
+            rules.append("only " + " ".join(sorted(suffix or '""' for suffix in self.suffixes)))
+        return "ignore rules: " + ", ".join(rules)
+
+    def extend(self, base: str, patterns: List[str]) -> "IgnoreRules":
+        if not patterns:
+            return self
+        return IgnoreRules(
+            self.root, suffixes=self.suffixes, ignore_files=self.ignore_files,
+            rules=self.rules + [(base, pattern) for pattern in patterns],
+        )
+
+    def for_directory(self, directory: Path, relative: str, names: Collection[str]) -> "IgnoreRules":
+        """
+        Returns the rules that apply below `directory`, which contains the files `names`.
+        """
+        patterns = []
+        for ignore_file in self.ignore_files:
+            if ignore_file in names:
+                patterns.extend(read_patterns(directory / ignore_file))
+        return self.extend(relative, patterns)
+
+    def ignored(self, relative: str, is_dir: bool) -> bool:
+        """
+        Returns whether the path `relative` (to `root`, with "/" separators) is ignored.
+        """
+        name = relative[relative.rfind("/")+1:]
+        if not is_dir and self.suffixes is not None:
+            dot = name.rfind(".")
+            if (name[dot:] if 0 < dot < len(name) - 1 else "") not in self.suffixes:
+                return True
+
+        (name_regex, name_rules), (path_regex, path_rules) = self.matchers[is_dir]
+        decision = None
+        match = name_regex.fullmatch(name) if name_regex else None
+        if match:
+            decision = name_rules[match.lastindex]
+        match = path_regex.fullmatch(relative) if path_regex else None
+        if match and (decision is None or path_rules[match.lastindex][0] > decision[0]):
+            decision = path_rules[match.lastindex]
+        return decision is not None and not decision[1]
+
+    def relative(self, file: Path) -> str:
+        try:
+            return file.relative_to(self.root).as_posix()
+        except ValueError:
+            return file.name
+
+    def __call__(self, file: Path, is_dir: Optional[bool] = None, **kwargs) -> bool:
+        """
+        Filter interface of `select_files`: returns whether `file` passes the rules.
+        """
+        return not self.ignored(self.relative(file), file.is_dir() if is_dir is None else is_dir)
@@ -0,0 +1,182 @@
+import json
+import os
+import posixpath
+import re
+from collections import deque
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from file_printing import read_bounded, relative_name
+from token_cache import content_hash
+
+
+PYTHON_SUFFIXES = (".py", ".pyi")
+JS_SUFFIXES = (".js", ".jsx", ".mjs", ".cjs", ".ts", ".tsx", ".svelte")
+# `import a.b as c, d` and `from .a import (b, c)`
+PYTHON_IMPORT = re.compile(r"^[ \t]*(?:from[ \t]+(\.*[\w.]*)[ \t]+import[ \t]+(\([^)]*\)|[^\n#;]+)|import[ \t]+([^\n#;]+))", re.M)
+# `import x from "a"`, `import "a"`, `export {x} from "a"`, `require("a")` and `import("a")`
+JS_IMPORT = re.compile(r"""(?:\bfrom|\bimport|\brequire[ \t]*\(|\bimport[ \t]*\()[ \t]*['"]([^'"\n]+)['"]""")
+# files a relative JS/TS specifier may point to, in order
+JS_RESOLUTIONS = ("", ".ts", ".tsx", ".js", ".jsx", ".mjs", ".cjs", ".svelte", ".json", "/index.ts", "/index.tsx", "/index.js", "/index.jsx")
+
+
+def import_specifiers(name: str, content: str) -> List[str]:
+    """
+    Returns what the file `name` imports, unresolved: Python modules as "[dots]module" and "[dots]module:name"
+    for `from module import name`, JS/TS module specifiers as written.
+    Imports are found with regular expressions, so it stays cheap; ones in strings count too.
+    """
+    suffix = posixpath.splitext(name)[1]
+    specifiers = []
+    if suffix in PYTHON_SUFFIXES:
+        for module, names, modules in PYTHON_IMPORT.findall(content):
+            if modules:
+                specifiers.extend(part.split()[0] for part in modules.split(",") if part.strip())
+            else:
+                specifiers.append(module)
+                for part in names.strip("()").split(","):
+                    if part.split() and part.split()[0] != "*":
+                        specifiers.append(f"{module}:{part.split()[0]}")
+    elif suffix in JS_SUFFIXES:
+        specifiers.extend(JS_IMPORT.findall(content))
+    return specifiers
+
+
+def module_names(name: str) -> Iterable[str]:
+    """
+    Returns the dotted names under which a Python file can be imported, from its full path
+    (pkg/mod.py: pkg.mod, pkg/__init__.py: pkg) down to its last part, so src/ layouts resolve too.
+    """
+    parts = name[:-len(posixpath.splitext(name)[1])].split("/")
+    if parts[-1] == "__init__":
+        parts = parts[:-1]
+    for i in range(len(parts)):
+        yield ".".join(parts[i:])
+
+
+class ImportGraph:
+    """
+    The imports between the files of a project, for --seed.
+
+    The import specifiers of every file are stored as JSON in `path` with the file's size, mtime and content
+    hash, so an update only reads the files whose size or mtime changed and only extracts the imports of the
+    ones whose content did. The resolved imports (`edges`) are stored too: they're resolved again for the
+    changed files, or for all files when files were added or removed, with dict lookups, so building the
+    graph stays linear in the number of files.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.specifiers: Dict[str, list] = {}
+        self.edges: Dict[str, List[str]] = {}
+        try:
+            stored = json.loads(self.path.read_text())
+            self.specifiers, self.edges = stored["specifiers"], stored["edges"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def update(self, files: List[Path], folder: Path, max_bytes: Optional[int] = None) -> int:
+        """
+        Makes the graph cover exactly `files` and saves the specifiers if any changed. Returns how many files were read.
+        """
+        entries, read = {}, 0
+        for file in files:
+            name = relative_name(file, folder).replace(os.sep, "/")
+            entry = self.specifiers.get(name)
+            try:
+                stat = file.stat()
+                stat = [stat.st_size, stat.st_mtime_ns]
+            except OSError:
+                stat = None
+            if entry is None or entry[0] != stat:
+                suffix = file.suffix
+                content = read_bounded(file, name, max_bytes)[0] if suffix in PYTHON_SUFFIXES + JS_SUFFIXES else None
+                read += content is not None
+                hash = content_hash(content) if content is not None else None
+                if entry is None or entry[1] != hash:
+                    entry = [stat, hash, import_specifiers(name, content) if content is not None else []]
+                else:
+                    entry = [stat, hash, entry[2]]
+            entries[name] = entry
+        if entries == self.specifiers and len(self.edges) == len(entries):
+            return read
+
+        if entries.keys() == self.specifiers.keys() and len(self.edges) == len(entries):
+            changed = [name for name, entry in entries.items() if entry[2] != self.specifiers[name][2]]
+        else:
+            changed, self.edges = list(entries), {}
+        self.specifiers = entries
+        self.edges.update(self._resolve(changed))
+        self.save()
+        return read
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        temporary.write_text(json.dumps({"specifiers": self.specifiers, "edges": self.edges}))
+        os.replace(temporary, self.path)
+
+    def _resolve(self, names: List[str]) -> Dict[str, List[str]]:
+        # dotted module names, the file nearest to the root wins
+        modules: Dict[str, str] = {}
+        for name in sorted(self.specifiers, key=lambda name: (name.count("/"), name)):
+            if name.endswith(PYTHON_SUFFIXES):
+                for module in module_names(name):
+                    modules.setdefault(module, name)
+
+        edges = {}
+        for name in names:
+            targets = []
+            python = name.endswith(PYTHON_SUFFIXES)
+            directory = posixpath.dirname(name)
+            for specifier in self.specifiers[name][2]:
+                target = self._resolve_python(name, specifier, modules) if python else self._resolve_js(directory, specifier)
+                if target and target != name and target not in targets:
+                    targets.append(target)
+            edges[name] = targets
+        return edges
+
+    @staticmethod
+    def _resolve_python(name: str, specifier: str, modules: Dict[str, str]) -> Optional[str]:
+        module, _, imported = specifier.partition(":")
+        level = len(module) - len(module.lstrip("."))
+        if level:
+            package = name.split("/")[:-level]
+            module = ".".join(package + [part for part in module[level:].split(".") if part])
+        # `from a import b` may import the module a.b, `import a.b.c` imports a.b.c or its nearest package
+        if imported:
+            candidates = [f"{module}.{imported}", module]
+        else:
+            parts = module.split(".")
+            candidates = [".".join(parts[:i]) for i in range(len(parts), 0, -1)]
+        for candidate in candidates:
+            if candidate in modules:
+                return modules[candidate]
+        return None
+
+    def _resolve_js(self, directory: str, specifier: str) -> Optional[str]:
+        # package imports aren't part of the project
+        if not specifier.startswith("."):
+            return None
+        base = posixpath.normpath(f"{directory}/{specifier}" if directory else specifier)
+        for ending in JS_RESOLUTIONS:
+            if base + ending in self.specifiers:
+                return base + ending
+        return None
+
+    def closure(self, seeds: List[str], depth: int) -> Dict[str, int]:
+        """
+        Returns the files `seeds` import, directly or through at most `depth` imports in total, with their
+        distance in imports (0 for the seeds themselves).
+        """
+        distances = {seed: 0 for seed in seeds}
+        queue = deque(seeds)
+        while queue:
+            name = queue.popleft()
+            if distances[name] == depth:
+                continue
+            for target in self.edges.get(name, ()):
+                if target not in distances:
+                    distances[target] = distances[name] + 1
+                    queue.append(target)
+        return distances
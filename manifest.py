@@ -0,0 +1,84 @@
+import argparse
+import json
+import os
+from pathlib import Path
+from typing import Iterable, List, Optional, Union
+
+from settings import MANIFEST_DIR
+from token_cache import content_hash
+
+
+# options that don't change the summary
+IGNORED_OPTIONS = {
+    "token_cache", "no_token_cache", "workers", "watch", "force", "manifest_dir", "hide_file_list", "detailed", "profile",
+    "profile_files", "batch", "io_threads",
+}
+
+
+def file_stat(file: Path) -> Optional[List[int]]:
+    try:
+        stat = file.stat()
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def input_digest(args: argparse.Namespace, files: Iterable[Path], layout: str, encoding: str) -> Optional[str]:
+    """
+    Returns a hash of everything a summary depends on: the effective options, the encoding, the folder
+    layout and the size and mtime of every selected file. File contents aren't read.
+    None when the summary also depends on the time (--prefer recent), so it can't be reused.
+    """
+    if args.prefer == "recent":
+        return None
+    options = {key: value for key, value in sorted(vars(args).items()) if key not in IGNORED_OPTIONS}
+    inputs = {
+        "options": options,
+        "encoding": encoding,
+        "layout": layout,
+        "files": [[str(file), file_stat(file)] for file in files],
+    }
+    return content_hash(json.dumps(inputs, default=str))
+
+
+class Manifest:
+    """
+    What an earlier run wrote to `output`: its input digest, the file list it printed and the stat of the output.
+    Stored as JSON in `directory`, named after the resolved output path.
+    """
+
+    def __init__(self, output: Path, directory: Path = MANIFEST_DIR):
+        self.output = output
+        self.path = Path(directory) / f"{content_hash(str(output.resolve()))}.json"
+
+    def load(self, inputs: Optional[str]) -> Optional[dict]:
+        """
+        Returns the stored run if it had the same `inputs` and the output is still the file it wrote, else None.
+        """
+        if inputs is None:
+            return None
+        try:
+            run = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            return None
+        if run.get("inputs") != inputs or run.get("output") != file_stat(self.output):
+            return None
+        return run
+
+    def save(
+        self, inputs: Optional[str], names: List[str], token_counts: List[Union[int, str]], included: List[bool], total_tokens: int,
+        savings: Optional[List[Optional[int]]] = None,
+    ) -> None:
+        run = {
+            "inputs": inputs,
+            "output": file_stat(self.output),
+            "names": names,
+            "token_counts": token_counts,
+            "included": included,
+            "total_tokens": total_tokens,
+            "savings": savings,
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        temporary.write_text(json.dumps(run))
+        os.replace(temporary, self.path)
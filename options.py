@@ -0,0 +1,126 @@
+import argparse
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from settings import (
+    EMBEDDINGS_TOP_K, MANIFEST_DIR, MAX_FILE_BYTES, MIN_SHARD_CONTENT_TOKENS, PINNED_PATTERNS, SEED_DEPTH, TOKEN_CACHE_PATH,
+)
+
+
+class OptionError(ValueError):
+    """
+    A combination of options that isn't valid, see `option_error`.
+    """
+
+
+def priority(value: str) -> Tuple[str, float]:
+    pattern, _, weight = value.rpartition("=")
+    return pattern, float(weight)
+
+
+def argument_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='Process some integers.')
+    parser.add_argument('--folder', type=str, default=None, help='folder contents to summarize, required unless --batch is given')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--exclude_indices', nargs='*', type=int, default=[], help='list of file indices to exclude from the summary, cannot be combined with include_indices')
+    group.add_argument('--include_indices', nargs='*', type=int, default=[], help='list of file indices to include in the summary, cannot be combined with exclude_indices')
+    parser.add_argument('--hide_file_list', default=False, action="store_true", help='don\'t output the file list')
+    parser.add_argument('--detailed', default=True, action="store_true", help='add token counts to the file list')
+    parser.add_argument('--exclude_files', nargs='*', type=str, default=[], help='list of file/folder paths to exclude from the summary')
+    parser.add_argument('--filter_tests', default=False, action="store_true", help='exclude test files and the files in test directories')
+    parser.add_argument('--filter_dotfiles', default=True, action="store_true", help='ignore both .file and .directory/')
+    parser.add_argument('--embeddings_selection', default=False, action="store_true", help='only include the files most relevant to the task instruction, ranked by a local TF-IDF index of the folder')
+    parser.add_argument('--seed', nargs='*', type=str, default=[], help='only include these files and the files they import, directly or indirectly')
+    parser.add_argument('--depth', type=int, default=SEED_DEPTH, help='number of imports --seed follows')
+    parser.add_argument('--top_k', type=int, default=EMBEDDINGS_TOP_K, help='number of files --embeddings_selection includes')
+    parser.add_argument('--python_only', default=False, action="store_true", help='only include python files')
+    parser.add_argument('--task_instruction', default="", help='text that is added to the "Task" section.')
+    parser.add_argument('--output', type=str, default=None, help='file to write the summary to, "-" for stdout (default: summary.txt in the folder)')
+    parser.add_argument('--token_cache', type=str, default=str(TOKEN_CACHE_PATH), help='SQLite file in which per-file token counts are cached between runs')
+    parser.add_argument('--no_token_cache', default=False, action="store_true", help='don\'t read or write the token count cache')
+    parser.add_argument('--ignore', nargs='*', type=str, default=[], help='gitignore-style patterns of files/folders to skip, applied after .gitignore and .summarizeignore')
+    parser.add_argument('--no_ignore_files', default=False, action="store_true", help='don\'t read .gitignore and .summarizeignore files')
+    parser.add_argument('--show_pruned', default=False, action="store_true", help='list skipped directories (node_modules, venv, ...) with their file counts in the folder layout')
+    parser.add_argument('--max_tokens', type=int, default=None, help='automatically select the files that best fill this token budget')
+    parser.add_argument('--pin', nargs='*', type=str, default=PINNED_PATTERNS, help='gitignore-style patterns of files that are always included with --max_tokens')
+    parser.add_argument('--priority', nargs='*', type=priority, default=[], help='PATTERN=WEIGHT pairs, files matching PATTERN are packed WEIGHT times as eagerly with --max_tokens')
+    parser.add_argument('--prefer', choices=["recent", "small"], default=None, help='with --max_tokens, prefer recently modified or small files')
+    parser.add_argument('--shard_tokens', type=int, default=None, help='split the summary into summary_001.txt, summary_002.txt, ... of at most this many tokens each')
+    parser.add_argument('--max_file_bytes', type=int, default=MAX_FILE_BYTES, help='files larger than this many bytes are summarized by their first and last lines')
+    parser.add_argument('--skeleton', default=False, action="store_true", help='summarize python files by their signatures, docstrings and type annotations, with bodies replaced by ...')
+    parser.add_argument('--max_file_tokens', type=int, default=None, help='files with more tokens than this are summarized by their first and last tokens')
+    parser.add_argument('--estimate', default=False, action="store_true", help='estimate the token counts of files that aren\'t included from their size, without reading them')
+    parser.add_argument('--count_cap', type=int, default=None, help='stop counting the tokens of files that aren\'t included once they have more than this many, listed as >N')
+    parser.add_argument('--no_tokens', default=False, action="store_true", help='only print the folder layout and file list, without reading files or loading the tokenizer')
+    parser.add_argument('--force', default=False, action="store_true", help='regenerate the summary even if nothing changed since the last run')
+    parser.add_argument('--manifest_dir', type=str, default=str(MANIFEST_DIR), help='folder in which the inputs of earlier runs are recorded, to skip unchanged runs')
+    parser.add_argument('--profile', nargs='?', const='-', default=None, help='report the time spent in each stage and I/O counters, to stderr or to the given JSON file')
+    parser.add_argument('--profile_files', type=int, default=10, help='number of slowest files listed per stage with --profile')
+    parser.add_argument('--batch', type=str, default=None, help='JSON manifest of folders to summarize in one process, each with its own options')
+    parser.add_argument('--watch', default=False, action="store_true", help='keep the summary up to date as files change, until interrupted')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='number of threads used to count tokens')
+    parser.add_argument('--io_threads', type=int, default=1, help='number of threads listing directories and reading files concurrently, which helps on network filesystems')
+    return parser
+
+
+def option_error(args: argparse.Namespace, shard_overhead: int = 0) -> Optional[str]:
+    """
+    Returns what is wrong with a combination of options, None if nothing is. `shard_overhead` is the measured
+    size of a --shard_tokens shard without files (see `shard_overhead`), once the folder layout is known.
+    """
+    if not args.folder and not args.batch:
+        return "--folder is required"
+    if args.batch and (args.watch or args.no_tokens):
+        return "--batch can't be combined with --watch or --no_tokens"
+    if args.watch and args.no_tokens:
+        return "--watch can't be combined with --no_tokens"
+    if args.estimate and args.count_cap is not None:
+        return "--estimate and --count_cap can't be combined"
+    if args.embeddings_selection and not args.task_instruction and not args.batch:
+        return "--embeddings_selection ranks files by --task_instruction, which is empty"
+    if (args.embeddings_selection or args.seed) and args.no_tokens:
+        return "--embeddings_selection and --seed read files, they can't be combined with --no_tokens"
+    if args.no_tokens and args.max_tokens is not None:
+        return "--max_tokens needs token counts, it can't be combined with --no_tokens"
+    if args.shard_tokens is not None and (args.no_tokens or args.watch or args.output == "-"):
+        return "--shard_tokens writes counted shards to files, it can't be combined with --no_tokens, --watch or --output -"
+    if args.shard_tokens is not None and args.shard_tokens - shard_overhead < MIN_SHARD_CONTENT_TOKENS:
+        overhead = f", {shard_overhead} for the folder layout and the task" if shard_overhead else ""
+        return (
+            f"--shard_tokens {args.shard_tokens} is too small: shards need at least"
+            f" {shard_overhead + MIN_SHARD_CONTENT_TOKENS} tokens{overhead}"
+        )
+    return None
+
+
+def option_argv(options: Dict[str, Any]) -> List[str]:
+    """
+    Returns the command line arguments for options by name: true flags, lists and values (false and null are left out).
+    """
+    argv = []
+    for key, value in options.items():
+        if value is True:
+            argv.append(f"--{key}")
+        elif isinstance(value, list):
+            argv.extend([f"--{key}", *map(str, value)])
+        elif value is not False and value is not None:
+            argv.append(f"--{key}={value}")
+    return argv
+
+
+def parse_options(folder: Optional[Path] = None, **options) -> argparse.Namespace:
+    """
+    Returns the options of a run like the command line would: `options` are summarize.py options by name.
+    Raises TypeError for an unknown option and OptionError for a combination that isn't valid, see `option_error`.
+    """
+    parser = argument_parser()
+    unknown = set(options) - set(vars(parser.parse_args([])))
+    if unknown:
+        raise TypeError(f"unknown options: {', '.join(sorted(unknown))}")
+    args = parser.parse_args(([f"--folder={folder}"] if folder is not None else []) + option_argv(options))
+    args.exclude_files = [Path(path) for path in args.exclude_files]
+    error = option_error(args)
+    if error:
+        raise OptionError(error)
+    return args
@@ -0,0 +1,428 @@
+from __future__ import annotations
+
+import argparse
+import filecmp
+import os
+import re
+import sys
+from contextlib import nullcontext
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Iterator, List, Optional, Union
+
+from file_printing import (
+    FileRecord, ShardWriter, SummaryWriter, estimate_records, iter_records, relative_name, separator_tokens,
+)
+from file_selection import PrunedDirectory, default_rules, filter_files, select_files
+from ignore_rules import IgnoreRules
+from options import OptionError
+from profiling import Profile, stage
+from settings import ESTIMATE_COVERAGE, IGNORE_FILES, INDEX_DIR, SUFFIX_TO_LANGUAGE, TEST_PATTERNS
+from token_budget import file_weights, matches, pack
+from token_cache import TokenCache
+from tokenization import estimate_error
+
+if TYPE_CHECKING:
+    from tiktoken import Encoding
+
+
+@dataclass
+class Selection:
+    """
+    Result of the selection stage of a summarize.py run.
+    `all_files` are listed in the folder layout, `files` (which also pass `filters`) in the info table.
+    `pruned_dirs` are the directories the walk skipped.
+    """
+    folder: Path
+    all_files: List[Path]
+    files: List[Path]
+    filters: List[Callable[..., bool]]
+    pruned_dirs: List[PrunedDirectory]
+
+
+def select(args: argparse.Namespace, profile: Optional[Profile] = None) -> Selection:
+    folder = Path(args.folder)
+    exclude_filter = filter_files(folder, args.exclude_files) if args.exclude_files else None
+
+    def excluded_directories(path: Path, is_dir: bool, **kwargs) -> bool:
+        # excluded files are filtered below, and listed in the layout
+        return not is_dir or exclude_filter(path)
+
+    # select files, directories rejected by the rules or excluded aren't walked
+    with stage(profile, "walk"):
+        all_files, walked_files = select_files(
+            folder,
+            filters=[excluded_directories] if exclude_filter else [],
+            prune=True,
+            rules=default_rules(
+                folder,
+                filter_dotfiles=args.filter_dotfiles,
+                patterns=args.ignore,
+                ignore_files=() if args.no_ignore_files else IGNORE_FILES,
+            ),
+            threads=args.io_threads,
+            **vars(args)
+        )
+    pruned_dirs = [path for path in walked_files if isinstance(path, PrunedDirectory)]
+
+    # the summary isn't part of its own input
+    output = output_path(args)
+    if output:
+        resolved = folder.resolve()
+        excluded = {
+            folder / path.relative_to(resolved)
+            for path in (output.resolve(), temporary_path(output).resolve()) if path.is_relative_to(resolved)
+        }
+        all_files = [file for file in all_files if file not in excluded]
+        if args.shard_tokens is not None:
+            shard = shard_pattern(output)
+            directory = output.parent.resolve()
+            all_files = [
+                file for file in all_files if not (shard.fullmatch(file.name) and file.parent.resolve() == directory)
+            ]
+
+    # optional filters
+    with stage(profile, "filters"):
+        filters = []
+        if args.filter_tests or args.python_only:
+            filters.append(IgnoreRules(
+                folder,
+                patterns=TEST_PATTERNS if args.filter_tests else [],
+                suffixes=[".py"] if args.python_only else None,
+                ignore_files=(),
+            ))
+        if exclude_filter:
+            filters.append(exclude_filter)
+        files = [file for file in all_files if
+                 all(filter(file, is_dir=False) for filter in filters)
+                 or file.name == "Pipfile"
+                 ]
+    return Selection(folder, all_files, files, filters, pruned_dirs)
+
+
+def index_selection(args: argparse.Namespace, n_files: int) -> List[bool]:
+    """
+    Returns which files to include according to exclude_indices or include_indices.
+    """
+    if args.include_indices:
+        include_indices = set(args.include_indices)
+        return [i in include_indices for i in range(n_files)]
+    exclude_indices = set(args.exclude_indices)
+    return [i not in exclude_indices for i in range(n_files)]
+
+
+def seed_distances(
+    args: argparse.Namespace, selection: Selection, profile: Optional[Profile] = None,
+) -> Optional[List[Optional[int]]]:
+    """
+    Returns how many imports away from the --seed files each file is, None for files more than --depth
+    imports away. None without --seed. Seeds are paths relative to the folder, or else to the working
+    directory; raises OptionError for a seed that isn't one of the selected files.
+    """
+    if not args.seed:
+        return None
+    from import_graph import ImportGraph
+    folder = selection.folder
+    graph = ImportGraph(folder / INDEX_DIR / "imports.json")
+    with stage(profile, "imports"):
+        read = graph.update(selection.files, folder, args.max_file_bytes)
+    if profile:
+        profile.count("files indexed", read)
+
+    names = [relative_name(file, folder).replace(os.sep, "/") for file in selection.files]
+    seeds = []
+    for seed in args.seed:
+        path = next((path for path in (folder / seed, Path(seed)) if path.is_file()), None)
+        name = relative_name(path.resolve(), folder.resolve()) if path else seed
+        name = name.replace(os.sep, "/")
+        if name not in graph.specifiers:
+            reason = "doesn't exist" if path is None else "is ignored, filtered out or outside of the folder"
+            raise OptionError(f"--seed {seed} isn't one of the selected files: it {reason}")
+        seeds.append(name)
+    distances = graph.closure(seeds, args.depth)
+    return [distances.get(name) for name in names]
+
+
+def included_files(
+    args: argparse.Namespace, selection: Selection, profile: Optional[Profile] = None,
+    distances: Optional[List[Optional[int]]] = None,
+) -> List[bool]:
+    """
+    Returns which files to include: by index, and with --embeddings_selection or --seed (see `seed_distances`)
+    only the --top_k files most relevant to the task instruction and the import closure of the seeds,
+    besides include_indices.
+    """
+    included = index_selection(args, len(selection.files))
+    if not args.embeddings_selection and distances is None:
+        return included
+
+    relevant = set()
+    if args.embeddings_selection:
+        from embeddings import RelevanceIndex
+        index = RelevanceIndex(selection.folder / INDEX_DIR / "relevance")
+        with stage(profile, "index"):
+            read = index.update(selection.files, selection.folder, args.max_file_bytes)
+        if profile:
+            profile.count("files indexed", read)
+        with stage(profile, "rank"):
+            relevant = set(index.top(args.task_instruction, args.top_k))
+    include_indices = set(args.include_indices)
+    return [
+        include and (
+            i in include_indices
+            or relative_name(file, selection.folder) in relevant
+            or (distances is not None and distances[i] is not None)
+        )
+        for i, (file, include) in enumerate(zip(selection.files, included))
+    ]
+
+
+def read_records(
+    args: argparse.Namespace, files: List[Path], folder: Path, enc: Encoding, cache: Optional[TokenCache],
+    profile: Optional[Profile] = None, cap: Optional[int] = None,
+) -> Iterator[FileRecord]:
+    return iter_records(
+        files, folder, enc, cache, args.workers, args.max_file_bytes, args.max_file_tokens, profile, args.io_threads,
+        args.skeleton, cap,
+    )
+
+
+def count_records(
+    args: argparse.Namespace, files: List[Path], included: List[bool], folder: Path, enc: Encoding,
+    cache: Optional[TokenCache], profile: Optional[Profile] = None,
+) -> Iterator[FileRecord]:
+    """
+    Returns the records of `files` in order. Included files are counted exactly; the others only get
+    estimated counts with --estimate (they aren't read), or counts up to --count_cap.
+    """
+    if not args.estimate and args.count_cap is None:
+        yield from read_records(args, files, folder, enc, cache, profile)
+        return
+    excluded = [file for file, include in zip(files, included) if not include]
+    exact = read_records(args, [file for file, include in zip(files, included) if include], folder, enc, cache, profile)
+    if args.estimate:
+        approximate = estimate_records(excluded, folder, enc)
+    else:
+        approximate = read_records(args, excluded, folder, enc, cache, profile, args.count_cap)
+    for include in included:
+        yield next(exact if include else approximate)
+
+
+def budget_selection(
+    args: argparse.Namespace, files: List[Path], names: List[str], token_counts: List[int],
+    included: List[bool], enc: Encoding, distances: Optional[List[Optional[int]]] = None,
+) -> List[bool]:
+    """
+    Packs the --max_tokens budget with the files in `included`; include_indices and --pin are pinned.
+    With `distances` from the --seed files, files count half as much per import they're away.
+    """
+    include_indices = set(args.include_indices)
+    pinned = [
+        i for i, name in enumerate(names)
+        if i in include_indices or (included[i] and matches(args.pin, name))
+    ]
+    # only files in `included` are packed, so the others (whose counts may be estimates) don't take budget
+    candidates = [i for i, include in enumerate(included) if include]
+    position = {i: j for j, i in enumerate(candidates)}
+    overhead = separator_tokens("```", "## file\n", enc)
+    packed_candidates = pack(
+        costs=[token_counts[i] + overhead for i in candidates],
+        weights=file_weights(
+            [files[i] for i in candidates], [names[i] for i in candidates], [token_counts[i] for i in candidates],
+            dict(args.priority), args.prefer, [distances[i] for i in candidates] if distances is not None else None,
+        ),
+        budget=args.max_tokens + overhead,
+        pinned=[position[i] for i in pinned],
+    )
+    packed = [False] * len(included)
+    for i, include in zip(candidates, packed_candidates):
+        packed[i] = include
+    for i in pinned:
+        packed[i] = True
+    return packed
+
+
+def folder_layout(selection: Selection, show_pruned: bool = False) -> str:
+    return "".join([
+        "\n" + (
+            file.placeholder(selection.folder, count=True) if isinstance(file, PrunedDirectory)
+            else str(file.relative_to(selection.folder))
+        )
+        for file in sorted(selection.all_files + (selection.pruned_dirs if show_pruned else []))
+    ])
+
+
+def output_path(args: argparse.Namespace) -> Optional[Path]:
+    """
+    Returns where the summary goes, None for stdout.
+    """
+    return None if args.output == "-" else Path(args.output) if args.output else Path(args.folder) / "summary.txt"
+
+
+def temporary_path(output: Path) -> Path:
+    """
+    Returns the file a summary is written to before it replaces `output`.
+    """
+    return output.with_name(f".{output.name}.tmp")
+
+
+def shard_path(output: Path, number: int) -> Path:
+    """
+    Returns the file shard `number` (from 1) of the summary `output` is written to with --shard_tokens.
+    """
+    return output.with_name(f"{output.stem}_{number:03d}{output.suffix}")
+
+
+def shard_pattern(output: Path) -> re.Pattern:
+    # the names of the shards of `output` and of their temporary files
+    return re.compile(rf"\.?{re.escape(output.stem)}_\d{{3,}}{re.escape(output.suffix)}(\.tmp)?")
+
+
+def write_shards(
+    output: Path, folder: Path, records: Iterable[FileRecord], layout: str, task_instruction: str,
+    enc: Encoding, shard_tokens: int, profile: Optional[Profile] = None,
+) -> List[int]:
+    """
+    Streams the summary of `records` into shards of at most `shard_tokens` tokens (see `ShardWriter`),
+    written like `write_summary` writes `output` to `shard_path(output, 1)`, `shard_path(output, 2)`, ...
+    Shards left from an earlier run with more of them are removed. Returns the token count of every shard.
+    """
+    shard_counts = []
+
+    def emit(number: int, text: str, tokens: int) -> None:
+        shard, temporary = shard_path(output, number), temporary_path(shard_path(output, number))
+        try:
+            temporary.write_text(text)
+            if not (shard.is_file() and filecmp.cmp(temporary, shard, shallow=False)):
+                os.replace(temporary, shard)
+        finally:
+            if temporary.exists():
+                temporary.unlink()
+        shard_counts.append(tokens)
+
+    writer = ShardWriter(emit, folder, enc, layout, task_instruction, shard_tokens)
+    for record in records:
+        with stage(profile, "write"):
+            writer.write(record)
+    with stage(profile, "write"):
+        writer.finish()
+        stale = len(shard_counts) + 1
+        while shard_path(output, stale).is_file():
+            shard_path(output, stale).unlink()
+            stale += 1
+    return shard_counts
+
+
+def write_summary(
+    output: Path, folder: Path, records: Iterable[FileRecord], layout: str, task_instruction: str,
+    enc: Encoding, on_record: Callable[[FileRecord], Any] = lambda record: True, profile: Optional[Profile] = None,
+) -> int:
+    """
+    Streams the summary of `records` to `output` and returns its section token total.
+    `on_record` is called for every record and decides whether it is written.
+
+    The summary is written to a temporary file first, which atomically replaces `output` only if
+    its content differs, so an unchanged summary keeps its mtime.
+    """
+    temporary = temporary_path(output) if output else None
+    try:
+        with (temporary.open("w") if output else nullcontext(sys.stdout)) as out:
+            writer = SummaryWriter(out, folder, enc)
+            for record in records:
+                if on_record(record):
+                    with stage(profile, "write"):
+                        writer.write(record)
+            with stage(profile, "write"):
+                writer.finish(layout, task_instruction)
+        with stage(profile, "write"):
+            if output and not (output.is_file() and filecmp.cmp(temporary, output, shallow=False)):
+                os.replace(temporary, output)
+    finally:
+        if output and temporary.exists():
+            temporary.unlink()
+    return writer.tokens
+
+
+def info_table(
+    names: List[str], token_counts: Optional[List[Union[int, str]]], included: List[bool], total_tokens: Optional[int],
+    filters: List[Callable[..., bool]], max_tokens: Optional[int] = None, savings: Optional[List[Optional[int]]] = None,
+) -> str:
+    """
+    Returns the numbered file list, without the tokens column and total when `token_counts` is None.
+    Token counts may be labels like "~120" (estimated) or ">5000" (counted up to a cap), see `token_label`.
+    `savings` adds a column with the tokens each file's --skeleton saved (None for files that aren't skeletons).
+    """
+    # prepare zfill and ljust arguments
+    max_index_digits = len(str(len(names)))
+    max_token_count_digits = max(map(len, map(str, token_counts)), default=1) if token_counts is not None else 0
+    saved_width = max([len("saved"), *(len(str(saved)) for saved in savings if saved is not None)]) if savings else 0
+
+    info = ""
+    if token_counts is not None:
+        info += "\ni".ljust(max_index_digits) + " [x] " + "tokens".ljust(max_token_count_digits) + " "
+        info += "saved".ljust(saved_width) + " file" if savings else "file"
+        for i, (token_count, name, include) in enumerate(zip(token_counts, names, included)):
+            token_count_str = str(token_count).ljust(max_token_count_digits)
+            checkbox = "[x]" if include else "[ ]"
+            if savings:
+                token_count_str += " " + ("" if savings[i] is None else str(savings[i])).ljust(saved_width)
+            info += f"\n{str(i).zfill(max_index_digits)} {checkbox} {token_count_str} {name}"
+    else:
+        info += "\ni".ljust(max_index_digits) + " [x] file"
+        for i, (name, include) in enumerate(zip(names, included)):
+            checkbox = "[x]" if include else "[ ]"
+            info += f"\n{str(i).zfill(max_index_digits)} {checkbox} {name}"
+    info += "\n"
+    if total_tokens is not None:
+        info += f"\ntotal tokens: {total_tokens}" + (f" (budget {max_tokens})" if max_tokens is not None else "")
+        if savings:
+            saved = sum(saved for saved, include in zip(savings, included) if include and saved is not None)
+            info += f"\nsaved by --skeleton: {saved}"
+        errors = {
+            SUFFIX_TO_LANGUAGE.get(Path(name).suffix, "") or "other": estimate_error(Path(name).suffix)
+            for name, token_count in zip(names, token_counts) if str(token_count).startswith("~")
+        }
+        if errors:
+            bounds = [f"{error:.0%} for {language}" for language, error in sorted(errors.items()) if error is not None]
+            unmeasured = [language for language, error in sorted(errors.items()) if error is None]
+            info += "\n~ estimated from the file size"
+            if bounds:
+                info += f", {ESTIMATE_COVERAGE:.0%} of files within " + ", ".join(bounds)
+            if unmeasured:
+                info += ("; " if bounds else ", ") + "no measured bound for " + ", ".join(unmeasured)
+        if any(str(token_count).startswith(">") for token_count in token_counts):
+            info += "\n> counted up to the cap"
+        info += "\n"
+    info += "\nfilters:"
+    for filter in filters:
+        info += f"\n  {getattr(filter, '__name__', filter)}"
+    return info
+
+
+def list_files(args: argparse.Namespace) -> RunResult:
+    """
+    A summarize.py run with --no_tokens: prints the folder layout and file list, without reading any file.
+    """
+    selection = select(args)
+    if len(selection.all_files) == 0:
+        print("NO FILES FOUND")
+        return RunResult(selection.folder, 0, 0, 0)
+
+    names = [relative_name(file, selection.folder) for file in selection.files]
+    included = index_selection(args, len(names))
+    print(folder_layout(selection, args.show_pruned))
+    print(info_table(names, None, included, None, selection.filters))
+    return RunResult(selection.folder, len(names), sum(included), 0)
+
+
+@dataclass
+class RunResult:
+    """
+    What one run did: how many files it selected and included, their section token total and
+    whether the existing summary was reused because nothing changed.
+    """
+    folder: Path
+    files: int
+    included: int
+    tokens: int
+    reused: bool = False
@@ -0,0 +1,115 @@
+import heapq
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import ContextManager, Dict, Iterator, List, Optional, Tuple
+
+
+class Profile:
+    """
+    Wall and CPU time per stage of a run, counters and the `slowest` files of the per-file stages.
+
+    Stages may be entered many times (per file or per batch), their times add up. While the profile is
+    entered as a context manager, os.stat, os.lstat, os.fstat and os.scandir calls are counted, and the
+    time until it's exited is reported as the "total" stage.
+    Stages, counters and files may be recorded from several threads; the times of a stage that runs on
+    several threads at once add up, so they can exceed the total.
+    """
+
+    def __init__(self, slowest: int = 10):
+        self.slowest = slowest
+        self.stages: Dict[str, List[float]] = {}
+        self.counters: Dict[str, int] = {}
+        self.files: Dict[str, List[Tuple[float, str]]] = {}
+        self._patched = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str, file: Optional[str] = None) -> Iterator[None]:
+        """
+        Times the block as part of stage `name`, and as one of the slowest files of that stage if `file` is given.
+        """
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall
+            self.add(name, wall, time.process_time() - cpu)
+            if file is not None:
+                self.file(name, file, wall)
+
+    def add(self, name: str, wall: float, cpu: float) -> None:
+        with self._lock:
+            times = self.stages.setdefault(name, [0.0, 0.0])
+            times[0] += wall
+            times[1] += cpu
+
+    def count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def file(self, kind: str, name: str, seconds: float) -> None:
+        with self._lock:
+            slowest = self.files.setdefault(kind, [])
+            if len(slowest) < self.slowest:
+                heapq.heappush(slowest, (seconds, name))
+            elif seconds > slowest[0][0]:
+                heapq.heapreplace(slowest, (seconds, name))
+
+    def _counting(self, counter: str, function):
+        def counted(*args, **kwargs):
+            self.count(counter)
+            return function(*args, **kwargs)
+        return counted
+
+    def __enter__(self) -> "Profile":
+        self._start = time.perf_counter(), time.process_time()
+        for name, counter in (("stat", "stat calls"), ("lstat", "stat calls"), ("fstat", "stat calls"), ("scandir", "directories visited")):
+            self._patched[name] = getattr(os, name)
+            setattr(os, name, self._counting(counter, self._patched[name]))
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        for name, function in self._patched.items():
+            setattr(os, name, function)
+        self._patched = {}
+        self.add("total", time.perf_counter() - self._start[0], time.process_time() - self._start[1])
+
+    def as_dict(self) -> dict:
+        return {
+            "stages": {name: {"wall": wall, "cpu": cpu} for name, (wall, cpu) in self.stages.items()},
+            "counters": dict(self.counters),
+            "slowest": {kind: [{"seconds": seconds, "file": name} for seconds, name in sorted(files, reverse=True)]
+                        for kind, files in self.files.items()},
+        }
+
+    def report(self) -> str:
+        name_width = max(map(len, [*self.stages, *self.counters, "stage"]))
+        report = f"\n{'stage'.ljust(name_width)}     wall      cpu"
+        for name, (wall, cpu) in self.stages.items():
+            report += f"\n{name.ljust(name_width)} {wall:7.3f}s {cpu:7.3f}s"
+        report += "\n"
+        for name, value in self.counters.items():
+            report += f"\n{name.ljust(name_width)} {value:>8}"
+        for kind, files in self.files.items():
+            report += f"\n\nslowest to {kind}:"
+            for seconds, name in sorted(files, reverse=True):
+                report += f"\n{seconds * 1000:9.1f}ms {name}"
+        return report
+
+    def write(self, destination: str) -> None:
+        """
+        Prints the report to stderr for "-", otherwise writes it as JSON to the `destination` file.
+        """
+        if destination == "-":
+            print(self.report(), file=sys.stderr)
+        else:
+            with open(destination, "w") as f:
+                json.dump(self.as_dict(), f, indent=2)
+
+
+def stage(profile: Optional[Profile], name: str, file: Optional[str] = None) -> ContextManager:
+    return profile.stage(name, file) if profile else nullcontext()
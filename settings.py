@@ -1,3 +1,5 @@
+from pathlib import Path
+
 SUFFIX_TO_LANGUAGE = {
     ".js": "javascript",
     ".css": "css",
@@ -22,4 +24,90 @@ FILETYPES_TO_INCLUDE = SUFFIX_TO_LANGUAGE.keys()
 # Filters
 
 FILTER_DOTFILES = True
-FILTER_TESTS = False
\ No newline at end of file
+FILTER_TESTS = False
+
+# gitignore-style patterns that are always applied, before the ignore files and --ignore patterns
+IGNORE_PATTERNS = [
+    # Django
+    "migrations*",
+    "admin*",
+    # Python
+    "__init__*",
+    "*venv*/",
+    # Django
+    "*htmlcov*/",
+    "*dist*/",
+    # Node
+    "*node_modules*/",
+    # ElderJs
+    "*___ELDER___*/",
+    # --embeddings_selection and --seed indexes
+    ".summarize_index/",
+]
+DOTFILE_PATTERN = ".*"
+# --filter_tests: test files, and every file below a test directory
+TEST_PATTERNS = ["*[Tt][Ee][Ss][Tt]*", "**/*[Tt][Ee][Ss][Tt]*/**"]
+
+# files that are always included when packing a --max_tokens budget
+PINNED_PATTERNS = ["Pipfile", "/README*"]
+
+# files in each directory from which ignore patterns are read
+IGNORE_FILES = (".gitignore", ".summarizeignore")
+
+# --shard_tokens: a shard must leave at least this many tokens for files, besides the folder layout and the task
+MIN_SHARD_CONTENT_TOKENS = 100
+
+# Reading: larger files are summarized by a head and tail excerpt
+
+MAX_FILE_BYTES = 1 << 20
+
+# Token estimates: bytes per token of each language in SUFFIX_TO_LANGUAGE for the cl100k_base encoding, and the
+# relative error that ESTIMATE_COVERAGE of the files are within. Measured on 11,298 files, selected with the default
+# rules (minified and built assets left out) from the sdists of ansible-core 2.21.5, checkov 3.3.29, copier 9.19.1,
+# django 6.1.2, gradio 6.30.0, jupyterlab 4.6.4, python-hcl2 8.1.4, python-terraform 0.10.1, sphinx 9.1.0,
+# terraform-compliance 1.15.1, terraform-validate 2.8.0 and tftest 1.8.8: the ratio with the smallest bound over all
+# files, and the bound that holds in each of those projects with at least 20 files of the language, rounded up to 5%.
+# Other projects differ, check yours with `python benchmark.py estimate --folder FOLDER`.
+# The corpus had no Terraform files, so its ratio is a guess without a bound.
+
+ESTIMATE_COVERAGE = 0.9
+
+BYTES_PER_TOKEN = {
+    "python": (4.5, 0.3),
+    "javascript": (3.5, 0.4),
+    "typescript": (4.05, 0.2),
+    "css": (3.15, 0.3),
+    "html": (3.8, 0.35),
+    "svelte": (3.25, 0.25),
+    "markdown": (4.2, 0.45),
+    "jinja2": (3.6, 0.3),
+    "yaml": (3.6, 0.35),
+    "json": (3.25, 0.4),
+    "terraform": (3.3, None),
+    "bash": (3.8, 0.2),
+    "": (4.05, 0.35),
+}
+
+# folder (in the summarized folder) in which the --embeddings_selection and --seed indexes are stored
+
+INDEX_DIR = ".summarize_index"
+
+# how many files --embeddings_selection selects, and how many imports deep --seed follows
+
+EMBEDDINGS_TOP_K = 20
+SEED_DEPTH = 2
+
+# Tokenizer: BPE ranks downloaded by tiktoken are kept here
+
+TIKTOKEN_CACHE_DIR = Path.home() / ".cache" / "summarize" / "tiktoken"
+
+# Token cache
+
+TOKEN_CACHE_PATH = Path.home() / ".cache" / "summarize" / "token_counts.sqlite"
+TOKEN_CACHE_MAX_ENTRIES = 200_000
+# seconds a run waits for another run's write to the cache before treating the lookup as a miss
+TOKEN_CACHE_TIMEOUT = 1.0
+
+# Manifests of earlier runs, used to skip regenerating an unchanged summary
+
+MANIFEST_DIR = Path.home() / ".cache" / "summarize" / "manifests"
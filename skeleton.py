@@ -0,0 +1,64 @@
+import ast
+from typing import List, Optional
+
+
+# assigned values longer than this are replaced by `...`
+MAX_VALUE_LENGTH = 60
+SKELETON_SUFFIXES = (".py", ".pyi")
+
+
+def _docstring(body: List[ast.stmt]) -> List[ast.stmt]:
+    if body and isinstance(body[0], ast.Expr) and isinstance(body[0].value, ast.Constant) and isinstance(body[0].value.value, str):
+        return [body[0]]
+    return []
+
+
+def _value(value: Optional[ast.expr]) -> Optional[ast.expr]:
+    if value is None or len(ast.unparse(value)) <= MAX_VALUE_LENGTH:
+        return value
+    return ast.Constant(...)
+
+
+def _statements(body: List[ast.stmt]) -> List[ast.stmt]:
+    """
+    Returns the statements of a module or class body that are part of its interface: its docstring,
+    imports, classes, function signatures and assignments, in the blocks (if, try, ...) they're in.
+    """
+    kept = _docstring(body)
+    for node in body[len(kept):]:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            kept.append(node)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            node.body = [*_docstring(node.body), ast.Expr(ast.Constant(...))]
+            kept.append(node)
+        elif isinstance(node, ast.ClassDef):
+            node.body = _statements(node.body) or [ast.Expr(ast.Constant(...))]
+            kept.append(node)
+        elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+            node.value = _value(node.value)
+            kept.append(node)
+        elif isinstance(node, (ast.If, ast.Try, ast.With)):
+            blocks = [node, *getattr(node, "handlers", [])]
+            for block in blocks:
+                block.body = _statements(block.body)
+            for field in ("orelse", "finalbody"):
+                if hasattr(node, field):
+                    setattr(node, field, _statements(getattr(node, field)))
+            if any(block.body for block in blocks) or getattr(node, "orelse", None) or getattr(node, "finalbody", None):
+                for block in blocks:
+                    block.body = block.body or [ast.Expr(ast.Constant(...))]
+                kept.append(node)
+    return kept
+
+
+def skeleton(source: str) -> Optional[str]:
+    """
+    Returns the outline of a Python module: its classes and function signatures with their docstrings and
+    type annotations, bodies replaced by `...`. None when `source` isn't valid Python.
+    """
+    try:
+        module = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return None
+    module.body = _statements(module.body)
+    return ast.unparse(module)
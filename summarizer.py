@@ -0,0 +1,346 @@
+from __future__ import annotations
+
+import argparse
+import io
+import sys
+from dataclasses import replace
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+
+from file_printing import FileRecord, SummaryWriter, directory_outline_compact, shard_overhead, token_label
+from manifest import Manifest, file_stat, input_digest
+from options import OptionError, option_error, parse_options
+from pipeline import (
+    RunResult, Selection, budget_selection, count_records, folder_layout, included_files, info_table, list_files,
+    output_path, seed_distances, select, shard_path, write_shards, write_summary,
+)
+from profiling import Profile, stage
+from token_cache import TokenCache
+from tokenization import get_encoding
+
+if TYPE_CHECKING:
+    from tiktoken import Encoding
+
+
+class Summarizer:
+    """
+    A summarize.py run as an object. Holds the encoder, the selected files, the records read so far and the
+    token cache between calls, so repeated calls on a folder only read the files that changed:
+
+        with Summarizer("project", task_instruction="...", max_tokens=8000) as summarizer:
+            text = summarizer.render()
+            ...  # files change
+            summarizer.refresh()
+            text = summarizer.render()
+
+    Options are the summarize.py options by name (see `parse_options`), or an `args` namespace.
+    `select` walks the folder once and `count` reads and counts the selected files once, with --estimate
+    and --count_cap for the files that aren't included; `render` and `write` use those until `refresh`
+    catches up with the changes. `run` is what summarize.py does.
+
+    Without `keep_content`, records are kept without their content, so memory doesn't grow with the size
+    of the project: files are read again when they are written.
+    """
+
+    def __init__(
+        self, folder: Optional[Path] = None, enc: Optional[Encoding] = None, args: Optional[argparse.Namespace] = None,
+        cache: Optional[TokenCache] = None, profile: Optional[Profile] = None, keep_content: bool = True, **options,
+    ):
+        self.args = args if args is not None else parse_options(folder, **options)
+        self._enc = enc
+        # a cache that is passed in belongs to the caller, which closes it
+        self.shared_cache = cache is not None
+        self._cache = cache
+        self.profile = profile
+        self.keep_content = keep_content
+        self.selection: Optional[Selection] = None
+        self.records: Dict[Path, FileRecord] = {}
+        self.stats: Dict[Path, Optional[List[int]]] = {}
+        # files whose records were kept without their content
+        self.dropped: Set[Path] = set()
+        # the included files, section token total and shard token counts of the last `render` or `write`
+        self.included: List[bool] = []
+        self.tokens = 0
+        self.shard_counts: Optional[List[int]] = None
+
+    @property
+    def enc(self) -> Encoding:
+        if self._enc is None:
+            self._enc = get_encoding()
+        return self._enc
+
+    @property
+    def cache(self) -> Optional[TokenCache]:
+        # opened on first use, and again after `run` closed it
+        if self._cache is None and not self.args.no_token_cache:
+            self._cache = TokenCache(Path(self.args.token_cache))
+        return self._cache
+
+    def select(self, refresh: bool = False) -> Selection:
+        """
+        Returns the selected files, walking the folder on the first call and with `refresh`.
+        """
+        if self.selection is None or refresh:
+            self.selection = select(self.args, self.profile)
+            selected = set(self.selection.files)
+            for file in [file for file in self.records if file not in selected]:
+                self._forget(file)
+        return self.selection
+
+    def _forget(self, file: Path) -> None:
+        self.records.pop(file, None)
+        self.stats.pop(file, None)
+        self.dropped.discard(file)
+
+    def _invalidate(self, changed: Optional[Iterable[Path]]) -> None:
+        # forgets the records of `changed`, or of the files whose size or mtime changed
+        if changed is None:
+            changed = [file for file, stat in self.stats.items() if file_stat(file) != stat]
+        for file in changed:
+            self._forget(file)
+
+    def _inclusion(self) -> Tuple[Optional[List[Optional[int]]], List[bool]]:
+        # the --seed distances and the files included by index, relevance or seed, before any budget
+        selection = self.select()
+        distances = seed_distances(self.args, selection, self.profile)
+        return distances, included_files(self.args, selection, self.profile, distances)
+
+    def _keep(self, record: FileRecord) -> None:
+        if self.keep_content or record.content is None:
+            self.records[record.path] = record
+            self.dropped.discard(record.path)
+        else:
+            self.records[record.path] = replace(record, content=None, section="")
+            self.dropped.add(record.path)
+
+    def _records(self, included: List[bool]) -> Iterator[FileRecord]:
+        """
+        Yields the record of every selected file, in order: the ones kept as they are, the others as they are
+        read and counted (see `count_records`). Included files are read again when their content was dropped
+        or their count is approximate.
+        """
+        if self.args.no_tokens:
+            raise ValueError("--no_tokens doesn't read or count files")
+        selection = self.select()
+        files = selection.files
+        stale = [
+            i for i, file in enumerate(files)
+            if file not in self.records or (included[i] and (file in self.dropped or self.records[file].approximation))
+        ]
+        for i in stale:
+            self.stats[files[i]] = file_stat(files[i])
+        fresh = count_records(
+            self.args, [files[i] for i in stale], [included[i] for i in stale], selection.folder, self.enc, self.cache,
+            self.profile,
+        )
+        stale = set(stale)
+        for i, file in enumerate(files):
+            if i in stale:
+                record = next(fresh)
+                self._keep(record)
+                yield record
+            else:
+                yield self.records[file]
+        if stale and self.cache:
+            self.cache.commit()
+
+    def count(self, changed: Optional[Iterable[Path]] = None) -> List[FileRecord]:
+        """
+        Returns the records of the selected files, in their order, reading and counting only the files that
+        weren't yet, and the ones that changed: those in `changed` if given, else those whose size or mtime did.
+        """
+        self._invalidate(changed)
+        _, included = self._inclusion()
+        for _ in self._records(included):
+            pass
+        return [self.records[file] for file in self.selection.files]
+
+    def refresh(self, changed: Optional[Iterable[Path]] = None, structural: bool = True) -> List[FileRecord]:
+        """
+        Catches up with the changes in the folder and returns the records, see `count`. The folder is walked
+        again unless `structural` is False, when the caller knows that no files were added or removed.
+        """
+        self.select(refresh=structural)
+        return self.count(changed)
+
+    def _written(self) -> Iterator[FileRecord]:
+        """
+        Yields the records to write and sets `included`: with a token budget (or shards, which list the counts
+        in their layout) after counting every file and packing the budget, otherwise as files are read.
+        """
+        selection = self.select()
+        distances, included = self._inclusion()
+        if self.args.max_tokens is not None or self.args.shard_tokens is not None:
+            for _ in self._records(included):
+                pass
+            if self.args.max_tokens is not None:
+                records = [self.records[file] for file in selection.files]
+                with stage(self.profile, "budget"):
+                    included = budget_selection(
+                        self.args, selection.files, [record.name for record in records],
+                        [record.tokens for record in records], included, self.enc, distances,
+                    )
+        self.included = included
+        return (record for record, include in zip(self._records(included), included) if include)
+
+    def render(self) -> str:
+        """
+        Returns the summary of the included files, as summarize.py writes it without --shard_tokens.
+        """
+        written = self._written()
+        out = io.StringIO()
+        writer = SummaryWriter(out, self.selection.folder, self.enc)
+        for record in written:
+            writer.write(record)
+        writer.finish(folder_layout(self.selection, self.args.show_pruned), self.args.task_instruction)
+        self.tokens = writer.tokens
+        self.shard_counts = None
+        return out.getvalue()
+
+    def write(self, output: Optional[Path] = None) -> RunResult:
+        """
+        Writes the summary, or its shards with --shard_tokens, to `output` (default: where summarize.py would).
+        Files that weren't read yet are read as the summary is written. Raises OptionError, before writing
+        anything, when the shards have no room for files besides the folder layout and the task.
+        """
+        selection = self.select()
+        output = output if output is not None else output_path(self.args)
+        written = self._written()
+        if self.args.shard_tokens is not None:
+            with stage(self.profile, "layout"):
+                layout = directory_outline_compact(
+                    selection.files, selection.folder, self.enc, token_counts=self.labels(),
+                )
+            error = option_error(
+                self.args, shard_overhead(selection.folder, self.enc, layout, self.args.task_instruction),
+            )
+            if error:
+                raise OptionError(error)
+            self.shard_counts = write_shards(
+                output, selection.folder, written, layout, self.args.task_instruction, self.enc,
+                self.args.shard_tokens, self.profile,
+            )
+            self.tokens = sum(self.shard_counts)
+        else:
+            with stage(self.profile, "layout"):
+                layout = folder_layout(selection, self.args.show_pruned)
+            self.tokens = write_summary(
+                output, selection.folder, written, layout, self.args.task_instruction, self.enc, profile=self.profile,
+            )
+            self.shard_counts = None
+        return RunResult(selection.folder, len(selection.files), sum(self.included), self.tokens)
+
+    def labels(self) -> List[Union[int, str]]:
+        """
+        Returns the token count of every selected file as listed, see `token_label`.
+        """
+        return [token_label(self.records[file]) for file in self.select().files]
+
+    def savings(self) -> Optional[List[Optional[int]]]:
+        if not self.args.skeleton:
+            return None
+        return [self.records[file].saved for file in self.select().files]
+
+    def table(self) -> str:
+        """
+        Returns the file list of the last `render` or `write`.
+        """
+        return info_table(
+            [self.records[file].name for file in self.select().files], self.labels(), self.included, self.tokens,
+            self.selection.filters, self.args.max_tokens, self.savings(),
+        )
+
+    def run(self) -> RunResult:
+        """
+        What summarize.py does: catch up with the folder, write the summary unless nothing changed since the
+        run that wrote it, and print the file list. With --profile, the time spent in each stage is reported
+        afterwards, unless the Summarizer was given a `profile` (that the caller reports).
+        """
+        if self.profile is not None or not self.args.profile:
+            return self._run()
+        with Profile(self.args.profile_files) as profile:
+            self.profile = profile
+            try:
+                result = self._run()
+            finally:
+                self.profile = None
+        profile.write(self.args.profile)
+        return result
+
+    def _run(self) -> RunResult:
+        if self.args.no_tokens:
+            return list_files(self.args)
+        warm = self.selection is not None
+        selection = self.select(refresh=warm)
+        if len(selection.all_files) == 0:
+            print("NO FILES FOUND")
+            return RunResult(selection.folder, 0, 0, 0)
+        if warm:
+            self._invalidate(None)
+
+        with stage(self.profile, "layout"):
+            layout = folder_layout(selection, self.args.show_pruned)
+        output = output_path(self.args)
+        log = sys.stdout if output else sys.stderr
+
+        # nothing changed since the run that wrote the current output: reuse it (shards aren't tracked)
+        manifest = Manifest(output, self.args.manifest_dir) if output and self.args.shard_tokens is None else None
+        with stage(self.profile, "manifest"):
+            inputs = input_digest(self.args, selection.files, layout, self.enc.name) if output else None
+            run = manifest.load(inputs) if manifest and not self.args.force else None
+        if run:
+            if not self.args.hide_file_list:
+                print(layout, file=log)
+                print(info_table(
+                    run["names"], run["token_counts"], run["included"], run["total_tokens"], selection.filters,
+                    self.args.max_tokens, run.get("savings"),
+                ), file=log)
+                print(f"\n{output} is up to date", file=log)
+            return RunResult(selection.folder, len(selection.files), sum(run["included"]), run["total_tokens"], reused=True)
+
+        result = self.write()
+        # a cache the run opened is closed like summarize.py always has, and opened again by the next call
+        if self._cache and not self.shared_cache:
+            cache = self._cache
+            with stage(self.profile, "cache"):
+                self.close()
+            if self.profile:
+                self.profile.count("cache hits", cache.hits)
+                self.profile.count("cache misses", cache.misses)
+
+        if not self.args.hide_file_list:
+            print(layout, file=log)
+            print(self.table(), file=log)
+        for number, tokens in enumerate(self.shard_counts or [], 1):
+            print(f"{shard_path(output, number)}: {tokens} tokens", file=log)
+
+        # recorded last, so a run that fails before its output is complete isn't reused
+        if manifest:
+            with stage(self.profile, "manifest"):
+                manifest.save(
+                    inputs, [self.records[file].name for file in selection.files], self.labels(), self.included,
+                    self.tokens, self.savings(),
+                )
+        return result
+
+    def close(self) -> None:
+        if self._cache and not self.shared_cache:
+            self._cache.close()
+            self._cache = None
+
+    def __enter__(self) -> "Summarizer":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def summarize_files(
+    args: argparse.Namespace, enc: Encoding, profile: Optional[Profile] = None, cache: Optional[TokenCache] = None,
+) -> RunResult:
+    """
+    Summarizes `args.folder` in one run, see `Summarizer.run`. A `cache` shared between runs is used as is,
+    otherwise the run opens and closes its own.
+    """
+    with Summarizer(args=args, enc=enc, cache=cache, profile=profile, keep_content=False) as summarizer:
+        return summarizer.run()
@@ -0,0 +1,26 @@
+from pathlib import Path
+
+import pytest
+import tiktoken
+
+from benchmark import bench_memory, bench_walk, make_tree
+
+
+@pytest.fixture
+def enc() -> tiktoken.Encoding:
+    """
+    Byte-level encoding, which is built locally instead of downloading the BPE ranks of a real one.
+    """
+    return tiktoken.Encoding(
+        "bytes", pat_str=r"\S+|\s+", mergeable_ranks={bytes([i]): i for i in range(256)}, special_tokens={},
+    )
+
+
+def test_walk_doesnt_stat_every_file(tmp_path: Path):
+    folder = tmp_path / "tree"
+    make_tree(folder, 2000)
+    bench_walk(folder)
+
+
+def test_summary_memory_doesnt_grow_with_the_project(tmp_path: Path, enc: tiktoken.Encoding):
+    bench_memory(tmp_path / "tree", enc, 5000, workers=2)
@@ -0,0 +1,109 @@
+import math
+import re
+import time
+from pathlib import Path
+from typing import Collection, Dict, List, Optional
+
+from ignore_rules import translate
+
+
+def matches(patterns: Collection[str], name: str) -> bool:
+    return any(re.fullmatch(translate(pattern)[0], name) for pattern in patterns)
+
+
+def file_weights(
+    files: List[Path],
+    names: List[str],
+    token_counts: List[int],
+    priorities: Dict[str, float] = {},
+    prefer: Optional[str] = None,
+    distances: Optional[List[Optional[int]]] = None,
+) -> List[float]:
+    """
+    Returns the priority of each file: the weight of the last gitignore-style pattern in `priorities`
+    matching its name (1 if none does), times a factor between 1 and 2 when preferring
+    "recent" (recently modified) or "small" files, halved for every import a file is away from
+    the --seed files when `distances` are given.
+    """
+    compiled = [(re.compile(translate(pattern)[0]), weight) for pattern, weight in priorities.items()]
+    now = time.time()
+    weights = []
+    for i, (file, name, tokens) in enumerate(zip(files, names, token_counts)):
+        weight = 1.0
+        for regex, pattern_weight in compiled:
+            if regex.fullmatch(name):
+                weight = pattern_weight
+        if prefer == "recent":
+            age_days = max(0.0, now - file.stat().st_mtime) / 86400
+            weight *= 1 + 1 / (1 + age_days)
+        elif prefer == "small":
+            weight *= 1 + 1 / math.log2(2 + tokens)
+        if distances is not None and distances[i] is not None:
+            weight *= 0.5 ** distances[i]
+        weights.append(weight)
+    return weights
+
+
+def pack(
+    costs: List[int],
+    weights: List[float],
+    budget: int,
+    pinned: Collection[int] = (),
+    refine: int = 32,
+    resolution: int = 512,
+) -> List[bool]:
+    """
+    Returns which items to include so their total cost stays within `budget` while the summed
+    value (weight * cost) is as large as possible. Pinned items are always included.
+
+    Items are added greedily by weight, largest first among equal weights. Then the `refine` least
+    valuable included items and most valuable excluded ones are re-packed exactly with a 0/1
+    knapsack over the free budget, with costs rounded up to `resolution` steps so it stays cheap.
+    """
+    included = [False] * len(costs)
+    free = budget
+    for i in pinned:
+        included[i] = True
+        free -= costs[i]
+
+    # by weight, then by cost, both descending (sorts are stable)
+    order = [i for i in range(len(costs)) if not included[i]]
+    order.sort(key=costs.__getitem__, reverse=True)
+    order.sort(key=weights.__getitem__, reverse=True)
+    for i in order:
+        if costs[i] <= free:
+            included[i] = True
+            free -= costs[i]
+    if free <= 0 or refine <= 0:
+        return included
+
+    pinned = set(pinned)
+    ins = [i for i in reversed(order) if included[i] and i not in pinned][:refine]
+    capacity = free + sum(costs[i] for i in ins)
+    outs = [i for i in order if not included[i] and costs[i] <= capacity][:refine]
+    candidates = ins + outs
+    if not outs:
+        return included
+
+    scale = max(1, math.ceil(capacity / resolution))
+    size = capacity // scale
+    best = [0.0] * (size + 1)
+    keep = []
+    for i in candidates:
+        cost = math.ceil(costs[i] / scale)
+        value = weights[i] * costs[i]
+        taken = bytearray(size + 1)
+        for c in range(size, cost - 1, -1):
+            if best[c - cost] + value > best[c]:
+                best[c] = best[c - cost] + value
+                taken[c] = 1
+        keep.append(taken)
+
+    if best[size] <= sum(weights[i] * costs[i] for i in ins):
+        return included
+    c = size
+    for i, taken in zip(reversed(candidates), reversed(keep)):
+        included[i] = bool(taken[c])
+        if taken[c]:
+            c -= math.ceil(costs[i] / scale)
+    return included
@@ -0,0 +1,161 @@
+import hashlib
+import sqlite3
+import time
+from pathlib import Path
+from typing import Optional, Tuple
+
+from settings import TOKEN_CACHE_MAX_ENTRIES, TOKEN_CACHE_PATH, TOKEN_CACHE_TIMEOUT
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8", "surrogatepass")).hexdigest()
+
+
+class TokenCache:
+    """
+    Persistent token counts, stored in a SQLite database.
+
+    Entries are keyed by (resolved path, section name, encoding name), so a file reached by another relative path
+    or through a symlink shares its entry. A lookup is a hit without reading the file when
+    size and mtime still match, and otherwise when the content hash still matches.
+    The least recently used entries are evicted on `close()` once `max_entries` is exceeded.
+
+    Several runs can share the cache: the database is in WAL mode, so reads don't wait for writes, and
+    writes are committed per batch (`commit`). A lookup or write that stays locked by another run for
+    `timeout` seconds is a miss or is skipped, so the cache never stops a run.
+
+    It also keeps the Python skeletons of file contents (see skeleton.py), keyed by content hash.
+    """
+
+    def __init__(
+        self, path: Path = TOKEN_CACHE_PATH, max_entries: int = TOKEN_CACHE_MAX_ENTRIES,
+        timeout: float = TOKEN_CACHE_TIMEOUT,
+    ):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(self.path), timeout=timeout)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS section_tokens ("
+            " path TEXT NOT NULL,"
+            " name TEXT NOT NULL,"
+            " encoding TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " mtime_ns INTEGER NOT NULL,"
+            " hash TEXT NOT NULL,"
+            " tokens INTEGER NOT NULL,"
+            " last_used REAL NOT NULL,"
+            " PRIMARY KEY (path, name, encoding))"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS section_tokens_last_used ON section_tokens (last_used)")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS skeletons (hash TEXT PRIMARY KEY, skeleton TEXT, last_used REAL NOT NULL)"
+        )
+
+    def __enter__(self) -> "TokenCache":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _row(self, key: str, name: str, encoding: str):
+        return self.db.execute(
+            "SELECT size, mtime_ns, hash, tokens FROM section_tokens WHERE path = ? AND name = ? AND encoding = ?",
+            (key, name, encoding),
+        ).fetchone()
+
+    def _touch(self, key: str, name: str, encoding: str, size: int, mtime_ns: int) -> None:
+        self.db.execute(
+            "UPDATE section_tokens SET size = ?, mtime_ns = ?, last_used = ? WHERE path = ? AND name = ? AND encoding = ?",
+            (size, mtime_ns, time.time(), key, name, encoding),
+        )
+
+    def get(self, file: Path, name: str, encoding: str, text: Optional[str] = None) -> Optional[int]:
+        """
+        Returns the cached token count of the section `name` rendered from `file`, or None on a miss.
+        `text` is only needed when size or mtime changed, to compare content hashes.
+        A file that can't be stat'ed (removed or unreadable since it was read) is a miss.
+        """
+        try:
+            key = str(file.resolve())
+            row = self._row(key, name, encoding)
+            stat = file.stat() if row is not None else None
+        except (OSError, sqlite3.OperationalError):
+            row = None
+        if row is None:
+            self.misses += 1
+            return None
+        size, mtime_ns, hash, tokens = row
+        if (size, mtime_ns) == (stat.st_size, stat.st_mtime_ns) or (
+            text is not None and hash == content_hash(text)
+        ):
+            try:
+                self._touch(key, name, encoding, stat.st_size, stat.st_mtime_ns)
+            except sqlite3.OperationalError:
+                pass
+            self.hits += 1
+            return tokens
+        self.misses += 1
+        return None
+
+    def put(self, file: Path, name: str, encoding: str, text: str, tokens: int) -> None:
+        """
+        Caches the token count of the section `name` rendered from `file`, unless the file can't be stat'ed
+        or the cache stays locked.
+        """
+        try:
+            key = str(file.resolve())
+            stat = file.stat()
+            self.db.execute(
+                "INSERT OR REPLACE INTO section_tokens VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, name, encoding, stat.st_size, stat.st_mtime_ns, content_hash(text), tokens, time.time()),
+            )
+        except (OSError, sqlite3.OperationalError):
+            pass
+
+    def skeleton(self, hash: str) -> Tuple[bool, Optional[str]]:
+        """
+        Returns whether the skeleton of the content with `hash` is cached, and the skeleton (None if it isn't valid Python).
+        """
+        row = None
+        try:
+            row = self.db.execute("SELECT skeleton FROM skeletons WHERE hash = ?", (hash,)).fetchone()
+            if row is not None:
+                self.db.execute("UPDATE skeletons SET last_used = ? WHERE hash = ?", (time.time(), hash))
+        except sqlite3.OperationalError:
+            pass
+        return (True, row[0]) if row is not None else (False, None)
+
+    def put_skeleton(self, hash: str, skeleton: Optional[str]) -> None:
+        try:
+            self.db.execute("INSERT OR REPLACE INTO skeletons VALUES (?, ?, ?)", (hash, skeleton, time.time()))
+        except sqlite3.OperationalError:
+            pass
+
+    def commit(self) -> None:
+        """
+        Commits the writes so far, which releases the write lock for other runs; they're dropped if it stays locked.
+        """
+        try:
+            self.db.commit()
+        except sqlite3.OperationalError:
+            self.db.rollback()
+
+    def evict(self) -> None:
+        for table in ("section_tokens", "skeletons"):
+            self.db.execute(
+                f"DELETE FROM {table} WHERE rowid NOT IN "
+                f"(SELECT rowid FROM {table} ORDER BY last_used DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+
+    def close(self) -> None:
+        try:
+            self.evict()
+        except sqlite3.OperationalError:
+            pass
+        self.commit()
+        self.db.close()
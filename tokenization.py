@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+from settings import BYTES_PER_TOKEN, SUFFIX_TO_LANGUAGE, TIKTOKEN_CACHE_DIR
+
+if TYPE_CHECKING:
+    from tiktoken import Encoding
+
+
+model = "gpt-3.5-turbo"  # "gpt-4"
+BATCH_SIZE = 256
+# a capped count encodes about this many characters per token of the cap before giving up on an exact count
+CAP_CHARS_PER_TOKEN = 8
+
+
+@lru_cache(maxsize=None)
+def get_encoding() -> Encoding:
+    """
+    Loads the tokenizer of `model` on first use instead of at import time.
+    Its BPE ranks are kept in TIKTOKEN_CACHE_DIR (unless the environment variable is set), so only the first run downloads them.
+    """
+    os.environ.setdefault("TIKTOKEN_CACHE_DIR", str(TIKTOKEN_CACHE_DIR))
+    import tiktoken
+    return tiktoken.encoding_for_model(model)
+
+
+def batch_size(workers: int) -> int:
+    return max(BATCH_SIZE, workers * 16)
+
+
+@lru_cache(maxsize=None)
+def executor(workers: int) -> ThreadPoolExecutor:
+    """
+    Returns the thread pool with `workers` threads, created once and shared by every count in the process.
+    """
+    return ThreadPoolExecutor(workers, thread_name_prefix="tokenize")
+
+
+def estimate_tokens(size: int, suffix: str) -> int:
+    """
+    Returns the approximate token count of a file of `size` bytes, from the bytes per token of its language.
+    """
+    bytes_per_token, _ = BYTES_PER_TOKEN.get(SUFFIX_TO_LANGUAGE.get(suffix, ""), BYTES_PER_TOKEN[""])
+    return round(size / bytes_per_token)
+
+
+def estimate_error(suffix: str) -> Optional[float]:
+    """
+    Returns the relative error that ESTIMATE_COVERAGE of the estimates are within, None if it wasn't measured.
+    """
+    return BYTES_PER_TOKEN.get(SUFFIX_TO_LANGUAGE.get(suffix, ""), BYTES_PER_TOKEN[""])[1]
+
+
+def capped_count(text: str, enc: Encoding, cap: int) -> int:
+    """
+    Returns the token count of `text`, or some count over `cap` when it has more tokens than that.
+    Long texts are encoded up to about `cap * CAP_CHARS_PER_TOKEN` characters first, and only encoded
+    in full if that part doesn't reach the cap.
+    """
+    end = cap * CAP_CHARS_PER_TOKEN
+    if len(text) > end:
+        end = text.rfind("\n", 0, end) + 1 or end
+        tokens = len(enc.encode_ordinary(text[:end]))
+        if tokens > cap:
+            return tokens
+    return len(enc.encode_ordinary(text))
+
+
+def count_tokens(
+    texts: List[str], enc: Encoding, workers: int = 1, timings: Optional[List[float]] = None, cap: Optional[int] = None,
+) -> List[int]:
+    """
+    Returns the token count of each text, in the same order as `texts`.
+
+    With `workers > 1` the texts are encoded on a shared pool of that many threads, like
+    `encode_ordinary_batch` does but without starting a new pool per call. tiktoken releases the GIL
+    while encoding, so this uses all cores without copying file contents to worker processes.
+    Only the counts are kept, not the token lists, and callers pass bounded batches (see `batch_size`).
+
+    When a `timings` list is passed, the encoding time of each text is appended to it.
+    With a `cap`, texts are counted with `capped_count`.
+    """
+    if cap is not None:
+        count = lambda text: capped_count(text, enc, cap)
+    else:
+        count = lambda text: len(enc.encode_ordinary(text))
+
+    if timings is not None:
+        def timed_count(text: str) -> Tuple[int, float]:
+            start = time.perf_counter()
+            return count(text), time.perf_counter() - start
+
+        if workers <= 1:
+            results = [timed_count(text) for text in texts]
+        else:
+            results = list(executor(workers).map(timed_count, texts))
+        timings.extend(seconds for _, seconds in results)
+        return [tokens for tokens, _ in results]
+
+    if workers <= 1:
+        return [count(text) for text in texts]
+    return list(executor(workers).map(count, texts))
@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import argparse
+import ctypes
+import ctypes.util
+import os
+import select as select_module
+import struct
+import sys
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Set, Tuple
+
+from pipeline import Selection, folder_layout, output_path, temporary_path
+from settings import IGNORE_FILES
+from summarizer import Summarizer
+
+if TYPE_CHECKING:
+    from tiktoken import Encoding
+
+
+# inotify event masks, see inotify(7)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+STRUCTURAL = IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_Q_OVERFLOW
+
+EVENT = struct.Struct("iIII")
+
+
+def directories(folder: Path, pruned: Iterable[Path]) -> List[Path]:
+    """
+    Returns `folder` and every directory below it, except the pruned ones and their contents.
+    """
+    pruned = {str(path) for path in pruned}
+    found, stack = [], [str(folder)]
+    while stack:
+        directory = stack.pop()
+        found.append(Path(directory))
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir() and entry.path not in pruned:
+                    stack.append(entry.path)
+    return found
+
+
+class InotifyWatcher:
+    """
+    Reports changes below the watched directories with Linux inotify, through ctypes.
+    """
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.directories: Dict[int, Path] = {}
+
+    def watch(self, selection: Selection) -> None:
+        mask = IN_MODIFY | IN_CLOSE_WRITE | STRUCTURAL
+        watched = set(self.directories.values())
+        for directory in directories(selection.folder, selection.pruned_dirs):
+            if directory not in watched:
+                wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), mask)
+                if wd >= 0:
+                    self.directories[wd] = directory
+
+    def changes(self, timeout: float) -> Tuple[Optional[Set[Path]], bool]:
+        """
+        Waits up to `timeout` seconds and returns (changed paths, whether files were added or removed).
+        The changed paths are None when the kernel's event queue overflowed, so events were lost.
+        """
+        if not select_module.select([self.fd], [], [], timeout)[0]:
+            return set(), False
+        changed, structural, overflow = set(), False, False
+        data = os.read(self.fd, 1 << 16)
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT.unpack_from(data, offset)
+            name = data[offset + EVENT.size:offset + EVENT.size + length].rstrip(b"\0")
+            offset += EVENT.size + length
+            if mask & IN_DELETE_SELF:
+                self.directories.pop(wd, None)
+            # the overflow event has no watch (wd is -1)
+            overflow = overflow or bool(mask & IN_Q_OVERFLOW)
+            structural = structural or bool(mask & STRUCTURAL)
+            if wd in self.directories:
+                changed.add(self.directories[wd] / os.fsdecode(name))
+        return None if overflow else changed, structural
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """
+    Reports changes by comparing the mtimes of the selected files and walked directories every `interval` seconds.
+    """
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self.snapshot: Dict[Path, Tuple[int, int]] = {}
+        self.directories: List[Path] = []
+
+    @staticmethod
+    def _stat(path: Path) -> Tuple[int, int]:
+        try:
+            stat = path.stat()
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return -1, -1
+
+    def watch(self, selection: Selection) -> None:
+        self.directories = directories(selection.folder, selection.pruned_dirs)
+        self.snapshot = {path: self._stat(path) for path in self.directories + selection.files}
+
+    def changes(self, timeout: float) -> Tuple[Set[Path], bool]:
+        time.sleep(min(timeout, self.interval))
+        changed = {path for path, stat in self.snapshot.items() if self._stat(path) != stat}
+        for path in changed:
+            self.snapshot[path] = self._stat(path)
+        return changed, any(path in changed for path in self.directories)
+
+    def close(self) -> None:
+        pass
+
+
+def watch(args: argparse.Namespace, enc: Encoding, debounce: float = 0.05, max_delay: float = 1.0) -> None:
+    """
+    Keeps the summary up to date: files are read and counted once, after that only changed files are.
+    Bursts of changes (a git checkout, ...) are handled together once `debounce` seconds pass without
+    new ones, or after `max_delay` seconds at most.
+    """
+    output = output_path(args)
+    log = sys.stdout if output else sys.stderr
+    # the summary's own writes aren't changes: paths are compared resolved, as --output and --folder may be spelled differently
+    written = {output.resolve(), temporary_path(output).resolve()} if output else set()
+    summarizer = Summarizer(args=args, enc=enc)
+
+    summarizer.refresh()
+    summarizer.write()
+    selection = summarizer.selection
+    print(folder_layout(selection, args.show_pruned), file=log)
+    print(summarizer.table(), file=log)
+
+    try:
+        watcher = InotifyWatcher()
+    except (OSError, AttributeError, TypeError):
+        watcher = PollingWatcher()
+    watcher.watch(selection)
+    print(f"\nwatching {selection.folder} ({type(watcher).__name__}), press Ctrl+C to stop", file=log)
+
+    try:
+        while True:
+            # changed is None once events were lost: then the folder is walked and every file checked again
+            changed, structural = watcher.changes(timeout=3600)
+            first = time.perf_counter()
+            while changed != set() and time.perf_counter() - first < max_delay:
+                more, more_structural = watcher.changes(timeout=debounce)
+                if more == set():
+                    break
+                changed = None if changed is None or more is None else changed | more
+                structural = structural or more_structural
+            if changed is not None:
+                changed = {path for path in changed if path.resolve() not in written}
+                if not changed:
+                    continue
+                structural = structural or any(path.name in IGNORE_FILES for path in changed)
+
+            start = time.perf_counter()
+            summary = "events lost, all files checked" if changed is None else f"{len(changed)} changed"
+            summarizer.refresh(changed, structural)
+            if structural:
+                watcher.watch(summarizer.selection)
+            result = summarizer.write()
+            print(
+                f"{time.strftime('%H:%M:%S')} {summary}, {result.included}/{result.files} files, "
+                f"{result.tokens} tokens ({(time.perf_counter() - start) * 1000:.0f} ms)",
+                file=log,
+            )
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+        summarizer.close()